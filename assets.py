@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pygame import image, transform
+
+from config import BACKGROUND_NAMES, FONT, IMAGE_PATH, IMG_NAMES
+
+# Invader and explosion sizes come from the wave definitions, see WaveSet.scaled_images.
+SCALED_IMAGES = [('mystery', (75, 35)), ('ship', (23, 23))]
+LOADER_THREADS = 4
+
+
+class AssetError(Exception):
+    pass
+
+
+_loader = None
+
+
+def get_loader():
+    global _loader
+    if _loader is None:
+        _loader = ThreadPoolExecutor(LOADER_THREADS, thread_name_prefix='assets')
+    return _loader
+
+
+class AssetManager(object):
+    # Surfaces handed out here are shared by every sprite and must never be drawn on.
+    def __init__(self, image_path=IMAGE_PATH, names=IMG_NAMES):
+        self.imagePath = image_path
+        self.paths = {name: os.path.join(image_path, '{}.png'.format(name)) for name in names}
+        self.backgroundNames = [name for name in BACKGROUND_NAMES
+                                if os.path.isfile(os.path.join(image_path, '{}.jpg'.format(name)))]
+        required = list(self.paths.values()) + [os.path.join(image_path, '{}.jpg'.format(BACKGROUND_NAMES[0])), FONT]
+        missing = [path for path in required if not os.path.isfile(path)]
+        if missing:
+            raise AssetError('Missing asset files:\n  ' + '\n  '.join(missing))
+        self.paths.update((name, os.path.join(image_path, '{}.jpg'.format(name))) for name in self.backgroundNames)
+        # Files are only checked here, decoding happens on first use or on the loader threads after preload().
+        self.images = {}
+        self.pending = {}
+        self.scaledImages = {}
+        self.converted = False
+
+    def __getitem__(self, name):
+        try:
+            return self.images[name]
+        except KeyError:
+            return self.load(name)
+
+    def load(self, name):
+        future = self.pending.pop(name, None)
+        surface = future.result() if future is not None else image.load(self.paths[name])
+        if self.converted:
+            surface = surface.convert() if name in self.backgroundNames else surface.convert_alpha()
+        self.images[name] = surface
+        return surface
+
+    def preload(self, names=None):
+        loader = get_loader()
+        futures = []
+        for name in self.paths if names is None else names:
+            if name not in self.images and name not in self.pending:
+                self.pending[name] = loader.submit(image.load, self.paths[name])
+            futures.append(self.pending.get(name))
+        return [future for future in futures if future is not None]
+
+    def convert(self):
+        # Pixel format conversion needs the display, so it stays on the main thread.
+        self.images = {name: img.convert() if name in self.backgroundNames else img.convert_alpha()
+                       for name, img in self.images.items()}
+        self.scaledImages = {}
+        self.converted = True
+
+    def prebuild(self, variants=SCALED_IMAGES):
+        for name, size in variants:
+            self.scaled(name, size)
+
+    def scaled(self, name, size):
+        key = (name, tuple(size))
+        surface = self.scaledImages.get(key)
+        if surface is None:
+            surface = self.scaledImages[key] = transform.scale(self[name], key[1])
+        return surface
+
+    def scaled_images(self):
+        return list(self.scaledImages.values())
+
+
+IMAGES = AssetManager()
@@ -0,0 +1,94 @@
+import os
+
+from pygame import mixer
+
+from assets import AssetError, get_loader
+from config import SOUND_PATH
+
+SOUND_CATEGORIES = {'shoot': 'shots',
+                    'shoot2': 'shots',
+                    'invaderkilled': 'explosions',
+                    'mysterykilled': 'explosions',
+                    'shipexplosion': 'explosions',
+                    'mysteryentered': 'mystery',
+                    '0': 'music', '1': 'music', '2': 'music', '3': 'music',
+                    }
+CATEGORY_CHANNELS = {'shots': 2, 'explosions': 3, 'music': 1, 'mystery': 1}
+SOUND_VOLUMES = {'mysteryentered': 0.3}
+
+_bank = None
+_pending = {}
+
+
+def get_sound_bank():
+    global _bank
+    if _bank is None:
+        _bank = SoundBank()
+    return _bank
+
+
+def sound_paths(sound_path=SOUND_PATH):
+    paths = {name: os.path.join(sound_path, '{}.wav'.format(name)) for name in SOUND_CATEGORIES}
+    missing = [path for path in paths.values() if not os.path.isfile(path)]
+    if missing:
+        raise AssetError('Missing sound files:\n  ' + '\n  '.join(missing))
+    return paths
+
+
+def preload_sounds(sound_path=SOUND_PATH):
+    if _bank is None and not _pending:
+        loader = get_loader()
+        _pending.update((name, loader.submit(mixer.Sound, path)) for name, path in sound_paths(sound_path).items())
+    return list(_pending.values())
+
+
+class SoundBank(object):
+    def __init__(self, sound_path=SOUND_PATH):
+        paths = sound_paths(sound_path)
+        self.sounds = {}
+        for name, path in paths.items():
+            future = _pending.pop(name, None)
+            self.sounds[name] = future.result() if future is not None else mixer.Sound(path)
+            self.sounds[name].set_volume(SOUND_VOLUMES.get(name, 1.0))
+
+        reserved = sum(CATEGORY_CHANNELS.values())
+        if mixer.get_num_channels() < reserved:
+            mixer.set_num_channels(reserved)
+        mixer.set_reserved(reserved)
+        self.channels = {}
+        index = 0
+        for category, count in CATEGORY_CHANNELS.items():
+            self.channels[category] = [mixer.Channel(index + offset) for offset in range(count)]
+            index += count
+        self.nextChannel = {category: 0 for category in CATEGORY_CHANNELS}
+        self.volume = 1.0
+
+    def set_volume(self, volume):
+        self.volume = min(1.0, max(0.0, volume))
+        for channels in self.channels.values():
+            for channel in channels:
+                channel.set_volume(self.volume)
+
+    def channel_for(self, category):
+        channels = self.channels[category]
+        for channel in channels:
+            if not channel.get_busy():
+                return channel
+        index = self.nextChannel[category]
+        self.nextChannel[category] = (index + 1) % len(channels)
+        return channels[index]
+
+    def play(self, name):
+        self.channel_for(SOUND_CATEGORIES[name]).play(self.sounds[name])
+
+    def playing(self, name):
+        sound = self.sounds[name]
+        return [channel for channel in self.channels[SOUND_CATEGORIES[name]] if channel.get_sound() is sound]
+
+    def fadeout(self, name, time):
+        for channel in self.playing(name):
+            channel.fadeout(time)
+
+    def stop(self, name):
+        for channel in self.playing(name):
+            channel.stop()
@@ -0,0 +1,131 @@
+import os
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import csv
+import json
+import multiprocessing
+import statistics
+from collections import Counter
+from time import perf_counter
+
+from bots import POLICIES
+from simulation import TICK_RATE, Simulation
+from waves import DEFAULT_WAVES, WAVES
+
+FIELDS = ['seed', 'difficulty', 'wave_set', 'policy', 'score', 'waves', 'ticks', 'seconds', 'ticks_per_second', 'finished']
+
+
+def play(config):
+    seed, difficulty, policy_name, max_ticks, waves = config
+    sim = Simulation(difficulty, seed, waves)
+    policy = POLICIES[policy_name](seed)
+    sim.start()
+    start = perf_counter()
+    while not sim.gameOver and sim.tick < max_ticks:
+        sim.step(*policy(sim))
+        del sim.events[:]
+    elapsed = perf_counter() - start
+    return {'seed': seed,
+            'difficulty': difficulty,
+            'wave_set': waves,
+            'policy': policy_name,
+            'score': sim.score,
+            'waves': sim.wave - 1,
+            'ticks': sim.tick,
+            'seconds': sim.tick / TICK_RATE,
+            'ticks_per_second': sim.tick / elapsed if elapsed else 0.0,
+            'finished': sim.gameOver,
+            }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def distribution(values):
+    return {'mean': statistics.fmean(values) if values else 0,
+            'min': min(values, default=0),
+            'p10': percentile(values, 0.1),
+            'p50': percentile(values, 0.5),
+            'p90': percentile(values, 0.9),
+            'max': max(values, default=0),
+            }
+
+
+def summarize(runs, wall_time, workers, waves=DEFAULT_WAVES):
+    totalTicks = sum(run['ticks'] for run in runs)
+    groups = {}
+    for run in runs:
+        groups.setdefault((run['difficulty'], run['policy']), []).append(run)
+    return {'games': len(runs),
+            'wave_set': waves,
+            'workers': workers,
+            'wall_seconds': wall_time,
+            'games_per_minute': len(runs) * 60 / wall_time if wall_time else 0,
+            'ticks_per_second': totalTicks / wall_time if wall_time else 0,
+            'configurations': [{'difficulty': difficulty,
+                                'policy': policy,
+                                'games': len(group),
+                                'unfinished': sum(1 for run in group if not run['finished']),
+                                'score': distribution([run['score'] for run in group]),
+                                'game_seconds': distribution([run['seconds'] for run in group]),
+                                'waves_survived': {str(waves): count for waves, count in
+                                                   sorted(Counter(run['waves'] for run in group).items())},
+                                }
+                               for (difficulty, policy), group in sorted(groups.items())],
+            }
+
+
+def run_batch(games, difficulties, policies, seed=0, max_ticks=TICK_RATE * 60 * 10, workers=None,
+              waves=DEFAULT_WAVES):
+    workers = workers or os.cpu_count() or 1
+    configs = [(seed + index, difficulty, policy, max_ticks, waves)
+               for difficulty in difficulties
+               for policy in policies
+               for index in range(games)]
+    start = perf_counter()
+    if workers == 1:
+        runs = [play(config) for config in configs]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            runs = pool.map(play, configs, chunksize=max(1, len(configs) // (workers * 8)))
+    return runs, summarize(runs, perf_counter() - start, workers, waves)
+
+
+def write_csv(path, runs):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(runs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play many headless Space Invaders games and report balance stats.')
+    parser.add_argument('--games', type=int, default=100, help='games per difficulty and policy')
+    parser.add_argument('--difficulty', type=int, nargs='+', default=[1], choices=[1, 2, 3])
+    parser.add_argument('--waves', choices=sorted(WAVES), default=DEFAULT_WAVES)
+    parser.add_argument('--policy', nargs='+', default=['tracker'], choices=sorted(POLICIES))
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, later games count up')
+    parser.add_argument('--max-ticks', type=int, default=TICK_RATE * 60 * 10, help='stop unfinished games here')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--json', help='write the summary and every run to this JSON file')
+    parser.add_argument('--csv', help='write one row per game to this CSV file')
+    args = parser.parse_args(argv)
+
+    runs, summary = run_batch(args.games, args.difficulty, args.policy, args.seed, args.max_ticks, args.workers,
+                              args.waves)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': summary, 'runs': runs}, f, indent=2)
+    if args.csv:
+        write_csv(args.csv, runs)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
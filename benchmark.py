@@ -0,0 +1,254 @@
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+from random import Random
+
+import pygame
+
+from leaderboard import MEMORY_DATABASE, Leaderboard
+from main import SpaceInvaders
+from profiling import PhaseClock
+from simulation import TICK_MS
+
+GAME_PHASES = ['check_input', 'enemies.update', 'allSprites.update', 'check_collisions', 'spawning', 'audio',
+               'drawing', 'display.update']
+SCREEN_PHASES = ['check_input', 'drawing', 'display.update']
+REGRESSION_THRESHOLD = 0.10
+# Sub-millisecond frame times jitter by more than any relative threshold, so smaller changes never count.
+REGRESSION_FLOOR_MS = 0.25
+WARMUP_FRAMES = 60
+REPEATS = 3
+ENDLESS_LIVES = 10 ** 6
+LATE_WAVE = 6
+SETTINGS_MOUSE = [(375, 325), (100, 100)]
+
+
+def start_game(game, rng):
+    game.start_game()
+    game.sim.lives = ENDLESS_LIVES
+
+
+def setup_late_wave(game, rng):
+    start_game(game, rng)
+    sim = game.sim
+    sim.begin_wave(LATE_WAVE, sim.time)
+    cells = [(row, column) for row in range(sim.enemies.rows) for column in range(sim.enemies.columns)]
+    for row, column in rng.sample(cells, len(cells) - 4):
+        sim.enemies.kill(row, column)
+
+
+def top_up_bullets(game, frame, rng, count=64):
+    sim = game.sim
+    while len(sim.enemyBullets) < count:
+        bullet = sim.bulletPool.acquire(rng.randrange(10, 790), rng.randrange(100, 560), 1, 5, 'enemylaser', 'center')
+        bullet.add(sim.enemyBullets, sim.allSprites)
+    if not sim.bullets:
+        sim.fire()
+
+
+def setup_mystery(game, rng):
+    start_game(game, rng)
+    keep_mystery(game, 0, rng)
+
+
+def keep_mystery(game, frame, rng):
+    mystery = game.sim.mysteryShip
+    if not 0 <= mystery.rect.x <= 700:
+        mystery.timer = game.sim.time - mystery.moveTime - 1
+        mystery.rect.x = 0
+        mystery.direction = 1
+
+
+def setup_damaged_bunkers(game, rng):
+    start_game(game, rng)
+    for bunker in game.sim.bunkers:
+        size = bunker.cellSize
+        for index in rng.sample(range(len(bunker.cells)), len(bunker.cells) * 2 // 3):
+            row, column = divmod(index, bunker.columns)
+            bunker.hit(pygame.Rect(bunker.rect.x + column * size, bunker.rect.y + row * size, size, size))
+
+
+def setup_stress(game, rng):
+    game.waves = 'stress'
+    start_game(game, rng)
+
+
+def setup_game_over(game, rng):
+    game.mainScreen = False
+    game.gameOver = True
+    game.highScores = [1500, 1200, 900, 640, 300]
+
+
+def setup_settings(game, rng):
+    game.mainScreen = False
+    game.settingsScreen = True
+
+
+SCENARIOS = {'full_formation': ('game', start_game, None),
+             'late_wave': ('game', setup_late_wave, None),
+             'max_bullets': ('game', start_game, top_up_bullets),
+             'mystery_ship': ('game', setup_mystery, keep_mystery),
+             'damaged_bunkers': ('game', setup_damaged_bunkers, None),
+             'stress': ('game', setup_stress, None),
+             'game_over': ('game_over', setup_game_over, None),
+             'settings': ('settings', setup_settings, None),
+             }
+
+
+def run_scenario(name, frames, seed=0, dirty=True, warmup=WARMUP_FRAMES):
+    kind, setup, per_frame = SCENARIOS[name]
+    rng = Random(seed)
+    # An in-memory leaderboard keeps benchmark games out of the player's results file.
+    leaderboard = Leaderboard(MEMORY_DATABASE, None)
+    game = SpaceInvaders(seed=seed, dirty=dirty, leaderboard=leaderboard)
+    setup(game, rng)
+    clock = PhaseClock()
+    game.sim.phaseClock = clock
+    game.renderer.invalidate()
+    samples = []
+    screenTime = 0
+    for frame in range(warmup + frames):
+        if per_frame:
+            per_frame(game, frame, rng)
+        clock.start()
+        game.check_input()
+        clock.lap('check_input')
+        if kind == 'game':
+            if not game.startGame:
+                break
+            game.update_game(TICK_MS)
+            clock.lap('audio')
+            game.draw_game()
+            dirtyRects = game.renderer.render()
+            clock.lap('drawing')
+            game.renderer.flip(dirtyRects)
+        elif kind == 'game_over':
+            screenTime += round(TICK_MS)
+            if screenTime - game.gameOverTimer > 3000:
+                game.gameOverTimer = screenTime
+            game.create_game_over(screenTime)
+            clock.lap('drawing')
+            game.renderer.flip(game.renderer.render())
+        else:
+            dirtyRects = game.draw_settings(SETTINGS_MOUSE[frame // 30 % len(SETTINGS_MOUSE)])
+            clock.lap('drawing')
+            game.renderer.flip(dirtyRects)
+        clock.lap('display.update')
+        # Warmup frames fill caches, pools and the first full redraw, none of which a steady frame pays for.
+        if frame >= warmup:
+            samples.append(dict(clock.times))
+    leaderboard.close()
+    return summarize(samples, GAME_PHASES if kind == 'game' else SCREEN_PHASES)
+
+
+def run_repeated(name, frames, seed=0, dirty=True, repeats=REPEATS, warmup=WARMUP_FRAMES):
+    runs = [run_scenario(name, frames, seed, dirty, warmup) for _ in range(max(1, repeats))]
+    return {'frames': runs[0]['frames'],
+            'repeats': repeats,
+            'frame_ms': median_stats([run['frame_ms'] for run in runs]),
+            'phases_ms': {phase: median_stats([run['phases_ms'][phase] for run in runs])
+                          for phase in runs[0]['phases_ms']},
+            }
+
+
+def median_stats(stats):
+    return {stat: statistics.median(entry[stat] for entry in stats) for stat in stats[0]}
+
+
+def percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {'mean': 0.0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+    return {'mean': statistics.fmean(ordered),
+            'p50': ordered[len(ordered) // 2],
+            'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            'max': ordered[-1],
+            }
+
+
+def summarize(samples, phases):
+    frameTimes = [sum(sample.values()) * 1000 for sample in samples]
+    return {'frames': len(samples),
+            'frame_ms': percentiles(frameTimes),
+            'phases_ms': {phase: percentiles([sample.get(phase, 0.0) * 1000 for sample in samples])
+                          for phase in phases},
+            }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD, floor=REGRESSION_FLOOR_MS):
+    regressions = []
+    for name, result in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        for stat in ('p50', 'p99'):
+            before = previous['frame_ms'][stat]
+            after = result['frame_ms'][stat]
+            if before > 0 and after - before > max(before * threshold, floor):
+                regressions.append({'scenario': name, 'stat': stat, 'baseline_ms': before, 'current_ms': after,
+                                    'change': after / before - 1})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark headless Space Invaders frames.')
+    parser.add_argument('scenarios', nargs='*', help='scenarios to run, all by default: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--warmup', type=int, default=WARMUP_FRAMES, help='frames run but not measured first')
+    parser.add_argument('--repeats', type=int, default=REPEATS,
+                        help='runs per scenario, every statistic is the median over them')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--full-redraw', action='store_true', help='benchmark without dirty rectangles')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against a results file written by an earlier run')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='relative frame time increase reported as a regression')
+    parser.add_argument('--floor', type=float, default=REGRESSION_FLOOR_MS,
+                        help='frame time increase in ms below which nothing counts as a regression')
+    args = parser.parse_args(argv)
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error('unknown scenario: ' + ', '.join(unknown))
+    results = {'meta': {'python': platform.python_version(),
+                        'pygame': pygame.version.ver,
+                        'platform': platform.platform(),
+                        'frames': args.frames,
+                        'warmup': args.warmup,
+                        'repeats': args.repeats,
+                        'seed': args.seed,
+                        'dirty': not args.full_redraw,
+                        },
+               'scenarios': {}}
+    for name in names:
+        result = results['scenarios'][name] = run_repeated(name, args.frames, args.seed, not args.full_redraw,
+                                                           args.repeats, args.warmup)
+        frame = result['frame_ms']
+        print('{:16} {:5d} frames  p50 {:7.3f} ms  p99 {:7.3f} ms'.format(name, result['frames'], frame['p50'],
+                                                                          frame['p99']))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.floor)
+        results['regressions'] = regressions
+        for regression in regressions:
+            print('REGRESSION {scenario} {stat}: {baseline_ms:.3f} ms -> {current_ms:.3f} ms '
+                  '({change:+.0%})'.format(**regression))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+from random import Random
+
+
+class IdlePolicy(object):
+    def __init__(self, seed=0):
+        pass
+
+    def __call__(self, sim):
+        return False, False, False
+
+
+class RandomPolicy(object):
+    def __init__(self, seed=0, hold=12):
+        self.random = Random(seed)
+        self.hold = hold
+        self.ticks = 0
+        self.action = (False, False, False)
+
+    def __call__(self, sim):
+        if self.ticks <= 0:
+            move = self.random.randrange(3)
+            self.action = (move == 1, move == 2, self.random.random() < 0.5)
+            self.ticks = self.random.randrange(1, self.hold + 1)
+        self.ticks -= 1
+        return self.action
+
+
+class TrackerPolicy(object):
+    def __init__(self, seed=0, dodge=True):
+        self.random = Random(seed)
+        self.dodge = dodge
+
+    def __call__(self, sim):
+        if not sim.shipAlive or not sim.enemies:
+            return False, False, False
+        shipX = sim.player.rect.centerx
+        if self.dodge:
+            for bullet in sim.enemyBullets:
+                if bullet.rect.bottom > sim.player.rect.top - 60 and abs(bullet.rect.centerx - shipX) < 30:
+                    away = bullet.rect.centerx >= shipX
+                    return away, not away, False
+        _, _, xs, _ = sim.enemies.positions()
+        centers = xs + sim.enemies.width // 2
+        target = int(centers[abs(centers - shipX).argmin()])
+        return target < shipX - 4, target > shipX + 4, abs(target - shipX) <= 16
+
+
+POLICIES = {'idle': IdlePolicy,
+            'random': RandomPolicy,
+            'tracker': TrackerPolicy,
+            }
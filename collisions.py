@@ -0,0 +1,47 @@
+BULLET_CELL_SIZE = 32
+BUNKER_CELL_SIZE = 64
+
+
+class SpatialHash(object):
+    def __init__(self, cell_size):
+        self.cellSize = cell_size
+        self.cells = {}
+
+    def __bool__(self):
+        return bool(self.cells)
+
+    def clear(self):
+        self.cells.clear()
+
+    def keys(self, rect):
+        size = self.cellSize
+        for cellX in range(rect.left // size, (rect.right - 1) // size + 1):
+            for cellY in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                yield cellX, cellY
+
+    def insert(self, item):
+        for key in self.keys(item.rect):
+            bucket = self.cells.get(key)
+            if bucket is None:
+                self.cells[key] = [item]
+            else:
+                bucket.append(item)
+
+    def rebuild(self, items):
+        self.cells.clear()
+        for item in items:
+            self.insert(item)
+
+    def query(self, rect):
+        found = []
+        for key in self.keys(rect):
+            for item in self.cells.get(key, ()):
+                if item not in found and item.rect.colliderect(rect):
+                    found.append(item)
+        return found
+
+
+def grid_range(start, end, origin, pitch, count):
+    first = max(0, (start - origin) // pitch)
+    last = min(count - 1, (end - 1 - origin) // pitch)
+    return range(first, last + 1)
@@ -0,0 +1,29 @@
+from os.path import abspath, dirname
+
+SCREEN_SIZE = (800, 600)
+
+BASE_PATH = abspath(dirname(__file__))
+FONT_PATH = BASE_PATH + '/fonts/'
+IMAGE_PATH = BASE_PATH + '/images/'
+SOUND_PATH = BASE_PATH + '/sounds/'
+
+WHITE = (255, 255, 255)
+GREEN = (78, 255, 87)
+YELLOW = (241, 255, 0)
+BLUE = (80, 255, 239)
+PURPLE = (203, 0, 255)
+RED = (237, 28, 36)
+
+FONT = FONT_PATH + 'space_invaders.ttf'
+SCORES_FILE = BASE_PATH + '/scores.txt'
+LEADERBOARD_FILE = BASE_PATH + '/leaderboard.sqlite3'
+WAVES_FILE = BASE_PATH + '/waves.json'
+
+IMG_NAMES = ['ship', 'mystery',
+             'enemy1_1', 'enemy1_2',
+             'enemy2_1', 'enemy2_2',
+             'enemy3_1', 'enemy3_2',
+             'explosionblue', 'explosiongreen', 'explosionpurple',
+             'laser', 'enemylaser']
+
+BACKGROUND_NAMES = ['background', 'background1', 'background2']
@@ -0,0 +1,285 @@
+import os
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import multiprocessing
+
+import numpy as np
+
+from config import SCREEN_SIZE
+from simulation import Simulation
+from waves import DEFAULT_WAVES, WAVES
+
+ACTIONS = [(False, False, False),
+           (True, False, False),
+           (False, True, False),
+           (False, False, True),
+           (True, False, True),
+           (False, True, True),
+           ]
+ACTION_NAMES = ['noop', 'left', 'right', 'fire', 'left_fire', 'right_fire']
+MAX_PLAYER_BULLETS = 2
+MAX_ENEMY_BULLETS = 8
+ENEMY_ROWS = 5
+ENEMY_COLUMNS = 10
+BUNKERS = 4
+STATE_SIZE = ENEMY_ROWS * ENEMY_COLUMNS + 4 + 3 + 2 + 2 * MAX_PLAYER_BULLETS + 2 * MAX_ENEMY_BULLETS + BUNKERS
+PIXEL_SCALE = 10
+PIXEL_VALUES = {'bunker': 80, 'enemy_bullet': 128, 'mystery': 160, 'enemy': 200, 'ship': 255, 'bullet': 255}
+
+
+def state_vector(sim):
+    width, height = SCREEN_SIZE
+    state = np.full(STATE_SIZE, -1.0, dtype=np.float32)
+    enemies = sim.enemies
+    end = ENEMY_ROWS * ENEMY_COLUMNS
+    # Larger formations from waves.json are seen through the classic 5x10 window at their top left.
+    alive = np.zeros((ENEMY_ROWS, ENEMY_COLUMNS), dtype=np.float32)
+    window = enemies.alive[:ENEMY_ROWS, :ENEMY_COLUMNS]
+    alive[:window.shape[0], :window.shape[1]] = window
+    state[:end] = alive.ravel()
+    state[end:end + 4] = (enemies.x / width, enemies.y / height, enemies.direction,
+                          enemies.moveTime / enemies.wave.moveTime)
+    end += 4
+    state[end:end + 3] = (sim.player.rect.centerx / width, sim.shipAlive, sim.lives / 3)
+    end += 3
+    mystery = sim.mysteryShip
+    state[end:end + 2] = (mystery.rect.centerx / width, mystery.visible)
+    end += 2
+    for index, bullet in enumerate(sim.bullets.sprites()[:MAX_PLAYER_BULLETS]):
+        state[end + index * 2:end + index * 2 + 2] = (bullet.rect.centerx / width, bullet.rect.centery / height)
+    end += 2 * MAX_PLAYER_BULLETS
+    # The lowest enemy bullets are the ones the ship has to dodge next.
+    enemyBullets = sorted(sim.enemyBullets.sprites(), key=lambda bullet: -bullet.rect.bottom)
+    for index, bullet in enumerate(enemyBullets[:MAX_ENEMY_BULLETS]):
+        state[end + index * 2:end + index * 2 + 2] = (bullet.rect.centerx / width, bullet.rect.centery / height)
+    end += 2 * MAX_ENEMY_BULLETS
+    bunkers = [bunker.aliveCells / len(bunker.cells) for bunker in sim.bunkers[:BUNKERS]]
+    state[end:end + len(bunkers)] = bunkers
+    return state
+
+
+class PixelRenderer(object):
+    def __init__(self, scale=PIXEL_SCALE):
+        self.scale = scale
+        self.shape = (SCREEN_SIZE[1] // scale, SCREEN_SIZE[0] // scale)
+        self.bunkers = None
+        self.bunkerVersions = None
+        self.bunkerPixels = None
+
+    def fill(self, pixels, left, top, width, height, value):
+        scale = self.scale
+        x0 = max(0, left // scale)
+        y0 = max(0, top // scale)
+        x1 = min(self.shape[1], max(x0 + 1, -(-(left + width) // scale)))
+        y1 = min(self.shape[0], max(y0 + 1, -(-(top + height) // scale)))
+        if x0 < x1 and y0 < y1:
+            pixels[y0:y1, x0:x1] = value
+
+    def render_bunkers(self, bunkers):
+        pixels = np.zeros(self.shape, dtype=np.uint8)
+        for bunker in bunkers:
+            size = bunker.cellSize
+            for index, cell in enumerate(bunker.cells):
+                if cell:
+                    row, column = divmod(index, bunker.columns)
+                    self.fill(pixels, bunker.rect.x + column * size, bunker.rect.y + row * size, size, size,
+                              PIXEL_VALUES['bunker'])
+        return pixels
+
+    def render(self, sim):
+        versions = [bunker.version for bunker in sim.bunkers]
+        if sim.bunkers is not self.bunkers or versions != self.bunkerVersions:
+            self.bunkers = sim.bunkers
+            self.bunkerVersions = versions
+            self.bunkerPixels = self.render_bunkers(sim.bunkers)
+        pixels = self.bunkerPixels.copy()
+        enemies = sim.enemies
+        if enemies:
+            _, _, xs, ys = enemies.positions()
+            for xpos, ypos in zip(xs.tolist(), ys.tolist()):
+                self.fill(pixels, xpos, ypos, enemies.width, enemies.height, PIXEL_VALUES['enemy'])
+        if sim.mysteryShip.visible:
+            self.fill(pixels, *sim.mysteryShip.rect, PIXEL_VALUES['mystery'])
+        for bullet in sim.enemyBullets:
+            self.fill(pixels, *bullet.rect, PIXEL_VALUES['enemy_bullet'])
+        for bullet in sim.bullets:
+            self.fill(pixels, *bullet.rect, PIXEL_VALUES['bullet'])
+        if sim.shipAlive:
+            self.fill(pixels, *sim.player.rect, PIXEL_VALUES['ship'])
+        return pixels
+
+
+class SpaceInvadersEnv(object):
+    def __init__(self, difficulty=1, observation='state', frame_skip=1, pixel_scale=PIXEL_SCALE, max_ticks=None,
+                 waves=DEFAULT_WAVES):
+        if observation not in ('state', 'pixels'):
+            raise ValueError('observation must be "state" or "pixels", not {!r}'.format(observation))
+        self.difficulty = difficulty
+        self.observation = observation
+        self.frameSkip = frame_skip
+        self.maxTicks = max_ticks
+        self.waves = waves
+        self.pixels = PixelRenderer(pixel_scale) if observation == 'pixels' else None
+        self.sim = None
+
+    @property
+    def observation_shape(self):
+        return self.pixels.shape if self.pixels else (STATE_SIZE,)
+
+    @property
+    def action_count(self):
+        return len(ACTIONS)
+
+    def observe(self):
+        if self.pixels:
+            return self.pixels.render(self.sim)
+        return state_vector(self.sim)
+
+    def reset(self, seed=None):
+        self.sim = Simulation(self.difficulty, seed, self.waves)
+        self.sim.start()
+        return self.observe()
+
+    def step(self, action):
+        sim = self.sim
+        if isinstance(action, tuple):
+            left, right, fire = action
+        else:
+            left, right, fire = ACTIONS[int(action)]
+        score = sim.score
+        for _ in range(self.frameSkip):
+            sim.step(left, right, fire)
+            del sim.events[:]
+            if sim.gameOver:
+                break
+        truncated = bool(self.maxTicks) and sim.tick >= self.maxTicks and not sim.gameOver
+        info = {'score': sim.score, 'lives': sim.lives, 'wave': sim.wave, 'tick': sim.tick, 'seed': sim.seed,
+                'truncated': truncated}
+        return self.observe(), sim.score - score, sim.gameOver or truncated, info
+
+
+class EnvBatch(object):
+    def __init__(self, count, stride, env_kwargs):
+        self.envs = [SpaceInvadersEnv(**env_kwargs) for _ in range(count)]
+        self.stride = stride
+        self.seeds = [None] * count
+
+    def reset(self, seeds):
+        self.seeds = list(seeds)
+        return [env.reset(seed) for env, seed in zip(self.envs, self.seeds)]
+
+    def step(self, actions):
+        results = []
+        for index, (env, action) in enumerate(zip(self.envs, actions)):
+            observation, reward, done, info = env.step(action)
+            if done:
+                # Finished games restart at once so every slot always holds a live game.
+                info['final_observation'] = observation
+                if self.seeds[index] is not None:
+                    self.seeds[index] += self.stride
+                observation = env.reset(self.seeds[index])
+            results.append((observation, reward, done, info))
+        return results
+
+
+def run_worker(pipe, count, stride, env_kwargs):
+    batch = EnvBatch(count, stride, env_kwargs)
+    while True:
+        command, data = pipe.recv()
+        if command == 'reset':
+            pipe.send(batch.reset(data))
+        elif command == 'step':
+            pipe.send(batch.step(data))
+        else:
+            pipe.close()
+            return
+
+
+class VectorEnv(object):
+    def __init__(self, num_envs, workers=0, **env_kwargs):
+        self.numEnvs = num_envs
+        self.single = SpaceInvadersEnv(**env_kwargs)
+        self.batch = None
+        self.pipes = []
+        self.processes = []
+        self.slices = []
+        if not workers:
+            self.batch = EnvBatch(num_envs, num_envs, env_kwargs)
+            return
+        workers = min(workers, num_envs)
+        start = 0
+        for worker in range(workers):
+            count = num_envs // workers + (worker < num_envs % workers)
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_worker, args=(child, count, num_envs, env_kwargs),
+                                              daemon=True)
+            process.start()
+            child.close()
+            self.pipes.append(parent)
+            self.processes.append(process)
+            self.slices.append(slice(start, start + count))
+            start += count
+
+    @property
+    def observation_shape(self):
+        return (self.numEnvs,) + self.single.observation_shape
+
+    def call(self, command, data):
+        if self.batch is not None:
+            return getattr(self.batch, command)(data)
+        for pipe, part in zip(self.pipes, self.slices):
+            pipe.send((command, data[part]))
+        results = []
+        for pipe in self.pipes:
+            results.extend(pipe.recv())
+        return results
+
+    def reset(self, seed=None):
+        seeds = [None if seed is None else seed + index for index in range(self.numEnvs)]
+        return np.stack(self.call('reset', seeds))
+
+    def step(self, actions):
+        results = self.call('step', list(actions))
+        observations, rewards, dones, infos = zip(*results)
+        return (np.stack(observations), np.array(rewards, dtype=np.float32), np.array(dones, dtype=bool),
+                list(infos))
+
+    def close(self):
+        for pipe in self.pipes:
+            pipe.send(('close', None))
+            pipe.close()
+        for process in self.processes:
+            process.join()
+        self.pipes = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description='Measure environment throughput with random actions.')
+    parser.add_argument('--envs', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=0, help='worker processes, 0 steps every game in-process')
+    parser.add_argument('--observation', choices=['state', 'pixels'], default='state')
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--waves', choices=sorted(WAVES), default=DEFAULT_WAVES)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with VectorEnv(args.envs, args.workers, observation=args.observation, waves=args.waves) as envs:
+        envs.reset(args.seed)
+        start = perf_counter()
+        for _ in range(args.steps):
+            envs.step(rng.integers(len(ACTIONS), size=args.envs))
+        elapsed = perf_counter() - start
+    print('{:.0f} env steps/s ({} envs, {} workers, {} observations)'.format(
+        args.steps * args.envs / elapsed, args.envs, args.workers, args.observation))
@@ -0,0 +1,194 @@
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+MAGIC = 0x53494642
+HEADER_FIELDS = ['magic', 'width', 'height', 'channels', 'slots', 'red', 'green', 'blue', 'sequence']
+SEQUENCE = HEADER_FIELDS.index('sequence')
+RED = HEADER_FIELDS.index('red')
+GRAY_WEIGHTS = (77, 150, 29)
+
+
+def header_size(slots):
+    return -(-8 * (len(HEADER_FIELDS) + slots) // 64) * 64
+
+
+def pixel_view(surface):
+    # The raw surface buffer viewed as (height, width, bytes per pixel) in native channel order, without a copy.
+    width, height = surface.get_size()
+    pixels = np.frombuffer(surface.get_buffer(), dtype=np.uint8)
+    return pixels.reshape(height, surface.get_pitch())[:, :width * 4].reshape(height, width, 4)
+
+
+def channel_offsets(surface):
+    return [shift // 8 for shift in surface.get_shifts()[:3]]
+
+
+def attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        memory = shared_memory.SharedMemory(name)
+        # Before Python 3.13 every attaching process registers the segment and unlinks it when it exits.
+        resource_tracker.unregister(memory._name, 'shared_memory')
+        return memory
+
+
+class FrameExporter(object):
+    def __init__(self, size, name=None, slots=4, scale=1, gray=False):
+        self.width = size[0] // scale
+        self.height = size[1] // scale
+        self.channels = 1 if gray else 4
+        self.slots = slots
+        self.scale = scale
+        self.gray = gray
+        self.frameSize = self.width * self.height * self.channels
+        offset = header_size(slots)
+        self.memory = shared_memory.SharedMemory(name, create=True, size=offset + slots * self.frameSize)
+        self.name = self.memory.name
+        self.header = np.ndarray(len(HEADER_FIELDS) + slots, dtype=np.uint64, buffer=self.memory.buf)
+        self.header[:4] = (MAGIC, self.width, self.height, self.channels)
+        self.header[4] = slots
+        self.frames = np.ndarray((slots, self.height, self.width, self.channels), dtype=np.uint8,
+                                 buffer=self.memory.buf, offset=offset)
+        self.offsets = None
+        self.sequence = 0
+        if gray:
+            self.scratch = np.empty((self.height, self.width), dtype=np.uint16)
+            self.channel = np.empty((self.height, self.width), dtype=np.uint16)
+
+    def publish(self, surface):
+        if surface.get_bytesize() != 4:
+            raise ValueError('only 32 bit surfaces can be exported')
+        if self.offsets is None:
+            self.offsets = channel_offsets(surface)
+            self.header[RED:RED + 3] = [0, 0, 0] if self.gray else self.offsets
+        pixels = pixel_view(surface)
+        if self.scale > 1:
+            pixels = pixels[::self.scale, ::self.scale]
+        pixels = pixels[:self.height, :self.width]
+        slot = self.sequence % self.slots
+        stamps = self.header[len(HEADER_FIELDS):]
+        stamps[slot] = 0
+        frame = self.frames[slot]
+        if self.gray:
+            np.multiply(pixels[..., self.offsets[0]], GRAY_WEIGHTS[0], out=self.scratch, dtype=np.uint16)
+            for index in (1, 2):
+                np.multiply(pixels[..., self.offsets[index]], GRAY_WEIGHTS[index], out=self.channel,
+                            dtype=np.uint16)
+                self.scratch += self.channel
+            self.scratch >>= 8
+            frame[..., 0] = self.scratch
+        else:
+            frame[...] = pixels
+        # Dropping the view releases the surface lock taken by get_buffer.
+        del pixels
+        self.sequence += 1
+        stamps[slot] = self.sequence
+        self.header[SEQUENCE] = self.sequence
+        return self.sequence
+
+    def close(self):
+        if self.memory is None:
+            return
+        del self.header, self.frames
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+
+class FrameReader(object):
+    def __init__(self, name):
+        self.memory = attach(name)
+        fields = np.ndarray(len(HEADER_FIELDS), dtype=np.uint64, buffer=self.memory.buf)
+        magic, width, height, channels, slots, red, green, blue, _ = (int(value) for value in fields)
+        if magic != MAGIC:
+            self.memory.close()
+            raise ValueError('{} is not a frame export'.format(name))
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.slots = slots
+        # The exporter only learns the channel order from its first frame, which may come after we attach.
+        self.offsets = (red, green, blue) if int(fields[SEQUENCE]) else None
+        self.header = np.ndarray(len(HEADER_FIELDS) + slots, dtype=np.uint64, buffer=self.memory.buf)
+        self.frames = np.ndarray((slots, height, width, channels), dtype=np.uint8, buffer=self.memory.buf,
+                                 offset=header_size(slots))
+
+    @property
+    def sequence(self):
+        return int(self.header[SEQUENCE])
+
+    def frame(self, sequence):
+        return self.frames[(sequence - 1) % self.slots]
+
+    def channel_offsets(self):
+        if self.offsets is not None:
+            return self.offsets
+        offsets = tuple(int(value) for value in self.header[RED:RED + 3])
+        if self.sequence:
+            self.offsets = offsets
+        return offsets
+
+    def rgb(self, frame):
+        if self.channels == 1:
+            return frame[..., 0]
+        red, green, blue = self.channel_offsets()
+        if red - green == green - blue == 1:
+            return frame[..., red::-1] if blue == 0 else frame[..., red:blue - 1:-1]
+        if green - red == blue - green == 1:
+            return frame[..., red:blue + 1]
+        return frame[..., [red, green, blue]]
+
+    def valid(self, sequence):
+        # A slot stays valid until the writer comes back round the ring to reuse it.
+        return sequence > 0 and int(self.header[len(HEADER_FIELDS) + (sequence - 1) % self.slots]) == sequence
+
+    def latest(self):
+        sequence = self.sequence
+        return sequence, self.frame(sequence) if sequence else None
+
+    def wait(self, after, timeout=None, interval=0.001):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.sequence <= after:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(interval)
+        return self.sequence
+
+    def close(self):
+        if self.memory is None:
+            return
+        del self.header, self.frames
+        self.memory.close()
+        self.memory = None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Follow the frames exported by main.py --export-frames.')
+    parser.add_argument('name', help='shared memory name printed by the game')
+    parser.add_argument('--frames', type=int, default=600, help='stop after this many frames')
+    args = parser.parse_args()
+
+    reader = FrameReader(args.name)
+    seen = dropped = torn = 0
+    last = reader.sequence
+    start = time.perf_counter()
+    while seen < args.frames:
+        sequence = reader.wait(last, timeout=5)
+        if sequence is None:
+            break
+        brightness = float(reader.rgb(reader.frame(sequence)).mean())
+        if not reader.valid(sequence):
+            torn += 1
+        dropped += sequence - last - 1
+        seen += 1
+        last = sequence
+    elapsed = time.perf_counter() - start
+    print('{} frames {}x{}x{} at {:.1f} fps, {} dropped, {} overwritten while reading, last brightness {:.1f}'.format(
+        seen, reader.width, reader.height, min(reader.channels, 3), seen / elapsed if elapsed else 0, dropped, torn,
+        brightness if seen else 0))
+    reader.close()
@@ -0,0 +1,182 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from config import LEADERBOARD_FILE, SCORES_FILE
+
+SCHEMA_VERSION = 1
+# The old game had a single mode, which is difficulty 1 now.
+LEGACY_DIFFICULTY = 1
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    score INTEGER NOT NULL,
+    difficulty INTEGER,
+    wave INTEGER,
+    ticks INTEGER,
+    seed INTEGER,
+    player TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_difficulty_score ON runs (difficulty, score DESC, created);
+CREATE INDEX IF NOT EXISTS runs_score ON runs (score DESC, created);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+'''
+COLUMNS = ['created', 'score', 'difficulty', 'wave', 'ticks', 'seed', 'player']
+INSERT = 'INSERT INTO runs ({}) VALUES ({})'.format(', '.join(COLUMNS), ', '.join('?' * len(COLUMNS)))
+TOPS = '''
+SELECT difficulty, score FROM (
+    SELECT difficulty, score, ROW_NUMBER() OVER (PARTITION BY difficulty ORDER BY score DESC, created) AS rank
+    FROM runs WHERE difficulty IS NOT NULL
+) WHERE rank <= ? ORDER BY difficulty, rank
+'''
+MEMORY_DATABASE = 'file:leaderboard?mode=memory&cache=shared'
+
+Run = namedtuple('Run', COLUMNS)
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=10, uri=path.startswith('file:'))
+    if not path.startswith('file:'):
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+class Leaderboard(object):
+    def __init__(self, path=LEADERBOARD_FILE, legacy_path=SCORES_FILE, size=5):
+        self.size = size
+        try:
+            self.connection = connect(path)
+            self.path = path
+            self.create(legacy_path)
+        except sqlite3.Error as error:
+            print('Could not open the leaderboard at {}, results will not be kept: {}'.format(path, error),
+                  file=sys.stderr)
+            self.path = MEMORY_DATABASE
+            self.connection = connect(self.path)
+            self.create(None)
+        self.tops = self.load_tops()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='leaderboard-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def create(self, legacy_path):
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            (version,) = self.connection.execute('PRAGMA user_version').fetchone()
+            if version < 1 and legacy_path:
+                self.connection.executemany(INSERT, self.legacy_runs(legacy_path))
+            self.connection.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+    @staticmethod
+    def legacy_runs(path):
+        # scores.txt kept a bare top five list with zero placeholders and no wave or player.
+        try:
+            with open(path) as f:
+                scores = [int(score) for score in json.load(f)]
+            created = os.path.getmtime(path)
+        except (OSError, ValueError, TypeError):
+            return []
+        return [(created, score, LEGACY_DIFFICULTY, None, None, None, None) for score in scores if score > 0]
+
+    def load_tops(self):
+        tops = {None: [run.score for run in self.top()]}
+        for difficulty, score in self.connection.execute(TOPS, (self.size,)):
+            tops.setdefault(difficulty, []).append(score)
+        return tops
+
+    def submit(self, score, difficulty=None, wave=None, ticks=None, seed=None, player=None):
+        # Game over only updates the cached tables, so no query runs on the main thread while the run is saved.
+        self.queue.put((time.time(), score, difficulty, wave, ticks, seed, player))
+        for key in {difficulty, None}:
+            self.tops[key] = sorted(self.tops.get(key, []) + [score], reverse=True)[:self.size]
+        scores = self.tops[difficulty]
+        return scores + [0] * (self.size - len(scores))
+
+    def top(self, limit=None, difficulty=None, since=None, until=None, player=None):
+        where = []
+        parameters = []
+        for column, operator, value in (('difficulty', '=', difficulty), ('created', '>=', since),
+                                        ('created', '<', until), ('player', '=', player)):
+            if value is not None:
+                where.append('{} {} ?'.format(column, operator))
+                parameters.append(value)
+        query = 'SELECT {} FROM runs'.format(', '.join(COLUMNS))
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY score DESC, created LIMIT ?'
+        parameters.append(limit or self.size)
+        return [Run(*row) for row in self.connection.execute(query, parameters)]
+
+    def scores(self, difficulty=None, limit=None):
+        limit = limit or self.size
+        scores = [run.score for run in self.top(limit, difficulty)]
+        return scores + [0] * (limit - len(scores))
+
+    def count(self, difficulty=None):
+        if difficulty is None:
+            return self.connection.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+        return self.connection.execute('SELECT COUNT(*) FROM runs WHERE difficulty = ?', (difficulty,)).fetchone()[0]
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.connection.close()
+
+    def run(self):
+        connection = connect(self.path)
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows:
+                    with connection:
+                        connection.executemany(INSERT, rows)
+            except sqlite3.Error as error:
+                print('Could not save {} result(s) to {}: {}'.format(len(rows), self.path, error), file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if None in batch:
+                connection.close()
+                return
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show the Space Invaders leaderboard.')
+    parser.add_argument('--difficulty', type=int, default=None)
+    parser.add_argument('--days', type=float, default=None, help='only runs from the last this many days')
+    parser.add_argument('--player', default=None)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--path', default=LEADERBOARD_FILE)
+    args = parser.parse_args()
+
+    board = Leaderboard(args.path)
+    since = time.time() - args.days * 86400 if args.days is not None else None
+    print('{} runs stored'.format(board.count(args.difficulty)))
+    for rank, run in enumerate(board.top(args.top, args.difficulty, since, player=args.player), 1):
+        print('{:3}. {:7} difficulty {} wave {} {} {}'.format(
+            rank, run.score, '-' if run.difficulty is None else run.difficulty, '-' if run.wave is None else run.wave,
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(run.created)), run.player or ''))
+    board.close()
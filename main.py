@@ -1,40 +1,30 @@
+from time import perf_counter
+
+# Taken before pygame and numpy are imported so --measure-startup includes the imports.
+STARTED = perf_counter()
+
 import pygame.font
 from pygame import *
+import argparse
+import atexit
 import sys
-from os.path import abspath, dirname
-from random import choice
-import json
-
-SCREEN_SIZE = pygame.Vector2(800, 600)
-screen = pygame.display.set_mode(SCREEN_SIZE)
-
-BASE_PATH = abspath(dirname(__file__))
-FONT_PATH = BASE_PATH + '/fonts/'
-IMAGE_PATH = BASE_PATH + '/images/'
-SOUND_PATH = BASE_PATH + '/sounds/'
+from concurrent.futures import wait as wait_futures
 
-WHITE = (255, 255, 255)
-GREEN = (78, 255, 87)
-YELLOW = (241, 255, 0)
-BLUE = (80, 255, 239)
-PURPLE = (203, 0, 255)
-RED = (237, 28, 36)
+from assets import IMAGES
+from audio import get_sound_bank, preload_sounds
+from config import FONT, GREEN, SCREEN_SIZE, WHITE, YELLOW
+from framebuffer import FrameExporter
+from leaderboard import Leaderboard
+from profiling import OVERLAY_POSITION, FrameProfiler
+from replay import Replay, ReplayRecorder
+from simulation import TICK_MS, TICK_RATE, MysteryExplosion, Simulation
+from render import DirtyRenderer, FormationCache, SpriteAtlas, StaticLayer
+from text import NumberText, render as render_text
+from waves import DEFAULT_WAVES, WAVES
 
-FONT = FONT_PATH + 'space_invaders.ttf'
-
-IMG_NAMES = ['ship', 'mystery',
-             'enemy1_1', 'enemy1_2',
-             'enemy2_1', 'enemy2_2',
-             'enemy3_1', 'enemy3_2',
-             'explosionblue', 'explosiongreen', 'explosionpurple',
-             'laser', 'enemylaser']
-
-IMAGES = {name: image.load(IMAGE_PATH + '{}.png'.format(name)).convert_alpha()
-          for name in IMG_NAMES}
-
-BLOCKERS_POSITION = 450
-ENEMY_DEFAULT_POSITION = 65
-ENEMY_MOVE_DOWN = 35
+MAX_TICKS_PER_FRAME = 5
+LOADING_FPS = 30
+LOADING_BAR = Rect(200, 320, 400, 24)
 
 
 class Button:
@@ -50,290 +40,65 @@ class Button:
         self.text.draw(surface)
 
     def check_hover(self, mouse_pos):
-        self.hover = self.rect.collidepoint(mouse_pos)
+        hover = bool(self.rect.collidepoint(mouse_pos))
+        changed = hover != self.hover
+        self.hover = hover
+        return changed
 
     def click(self):
         if self.hover:
             self.callback()
 
 
-class Ship(sprite.Sprite):
-    def __init__(self):
-        sprite.Sprite.__init__(self)
-        self.image = IMAGES['ship']
-        self.rect = self.image.get_rect(topleft=(375, 540))
-        self.speed = 5
-
-    def update(self, keys, *args):
-        if keys[K_LEFT] and self.rect.x > 10:
-            self.rect.x -= self.speed
-        if keys[K_RIGHT] and self.rect.x < 740:
-            self.rect.x += self.speed
-        game.screen.blit(self.image, self.rect)
-
-
-class Bullet(sprite.Sprite):
-    def __init__(self, xpos, ypos, direction, speed, filename, side):
-        sprite.Sprite.__init__(self)
-        self.image = IMAGES[filename]
-        self.rect = self.image.get_rect(topleft=(xpos, ypos))
-        self.speed = speed
-        self.direction = direction
-        self.side = side
-        self.filename = filename
-
-    def update(self, keys, *args):
-        game.screen.blit(self.image, self.rect)
-        self.rect.y += self.speed * self.direction
-        if self.rect.y < 15 or self.rect.y > 600:
-            self.kill()
-
-
-class Enemy(sprite.Sprite):
-    def __init__(self, row, column):
-        sprite.Sprite.__init__(self)
-        self.row = row
-        self.column = column
-        self.images = []
-        self.load_images()
-        self.index = 0
-        self.image = self.images[self.index]
-        self.rect = self.image.get_rect()
-
-    def toggle_image(self):
-        self.index += 1
-        if self.index >= len(self.images):
-            self.index = 0
-        self.image = self.images[self.index]
-
-    def update(self, *args):
-        game.screen.blit(self.image, self.rect)
-
-    def load_images(self):
-        images = {0: ['1_2', '1_1'],
-                  1: ['2_2', '2_1'],
-                  2: ['2_2', '2_1'],
-                  3: ['3_1', '3_2'],
-                  4: ['3_1', '3_2'],
-                  }
-        img1, img2 = (IMAGES['enemy{}'.format(img_num)] for img_num in images[self.row])
-        self.images.append(transform.scale(img1, (40, 35)))
-        self.images.append(transform.scale(img2, (40, 35)))
-
-
-class EnemiesGroup(sprite.Group):
-    def __init__(self, columns, rows):
-        sprite.Group.__init__(self)
-        self.enemies = [[None] * columns for _ in range(rows)]
-        self.columns = columns
-        self.rows = rows
-        self.leftAddMove = 0
-        self.rightAddMove = 0
-        self.moveTime = 600
-        self.direction = 1
-        self.rightMoves = 30
-        self.leftMoves = 30
-        self.moveNumber = 15
-        self.timer = time.get_ticks()
-        self.bottom = game.enemyPosition + ((rows - 1) * 45) + 35
-        self._aliveColumns = list(range(columns))
-        self._leftAliveColumn = 0
-        self._rightAliveColumn = columns - 1
-
-    def update(self, current_time):
-        if current_time - self.timer > self.moveTime:
-            if self.direction == 1:
-                max_move = self.rightMoves + self.rightAddMove
-            else:
-                max_move = self.leftMoves + self.leftAddMove
-
-            if self.moveNumber >= max_move:
-                self.leftMoves = 30 + self.rightAddMove
-                self.rightMoves = 30 + self.leftAddMove
-                self.direction *= -1
-                self.moveNumber = 0
-                self.bottom = 0
-                for enemy in self:
-                    enemy.rect.y += ENEMY_MOVE_DOWN
-                    enemy.toggle_image()
-                    if self.bottom < enemy.rect.y + 35:
-                        self.bottom = enemy.rect.y + 35
-            else:
-                velocity = 10 if self.direction == 1 else -10
-                for enemy in self:
-                    enemy.rect.x += velocity
-                    enemy.toggle_image()
-                self.moveNumber += 1
-            self.timer += self.moveTime
-
-    def add_internal(self, *sprites):
-        super(EnemiesGroup, self).add_internal(*sprites)
-        for s in sprites:
-            self.enemies[s.row][s.column] = s
-
-    def remove_internal(self, *sprites):
-        super(EnemiesGroup, self).remove_internal(*sprites)
-        for s in sprites:
-            self.kill(s)
-        self.update_speed()
-
-    def is_column_dead(self, column):
-        return not any(self.enemies[row][column] for row in range(self.rows))
-
-    def random_bottom(self):
-        col = choice(self._aliveColumns)
-        col_enemies = (self.enemies[row - 1][col] for row in range(self.rows, 0, -1))
-        return next((en for en in col_enemies if en is not None), None)
-
-    def update_speed(self):
-        if len(self) == 1:
-            self.moveTime = 200
-        elif len(self) <= 10:
-            self.moveTime = 400
-
-    def kill(self, enemy):
-        self.enemies[enemy.row][enemy.column] = None
-        is_column_dead = self.is_column_dead(enemy.column)
-        if is_column_dead:
-            self._aliveColumns.remove(enemy.column)
-
-        if enemy.column == self._rightAliveColumn:
-            while self._rightAliveColumn > 0 and is_column_dead:
-                self._rightAliveColumn -= 1
-                self.rightAddMove += 5
-                is_column_dead = self.is_column_dead(self._rightAliveColumn)
-
-        elif enemy.column == self._leftAliveColumn:
-            while self._leftAliveColumn < self.columns and is_column_dead:
-                self._leftAliveColumn += 1
-                self.leftAddMove += 5
-                is_column_dead = self.is_column_dead(self._leftAliveColumn)
-
-
-class Blocker(sprite.Sprite):
-    def __init__(self, size, color, row, column):
-        sprite.Sprite.__init__(self)
-        self.height = size
-        self.width = size
-        self.color = color
-        self.image = Surface((self.width, self.height))
-        self.image.fill(self.color)
-        self.rect = self.image.get_rect()
-        self.row = row
-        self.column = column
-
-    def update(self, keys, *args):
-        game.screen.blit(self.image, self.rect)
-
-
-class Mystery(sprite.Sprite):
-    def __init__(self):
-        sprite.Sprite.__init__(self)
-        self.image = IMAGES['mystery']
-        self.image = transform.scale(self.image, (75, 35))
-        self.rect = self.image.get_rect(topleft=(-80, 45))
-        self.row = 5
-        self.moveTime = 25000
-        self.direction = 1
-        self.timer = time.get_ticks()
-        self.mysteryEntered = mixer.Sound(SOUND_PATH + 'mysteryentered.wav')
-        self.mysteryEntered.set_volume(0.3)
-        self.playSound = True
-
-    def update(self, keys, currentTime, *args):
-        resetTimer = False
-        passed = currentTime - self.timer
-        if passed > self.moveTime:
-            if (self.rect.x < 0 or self.rect.x > 800) and self.playSound:
-                self.mysteryEntered.play()
-                self.playSound = False
-            if self.rect.x < 840 and self.direction == 1:
-                self.mysteryEntered.fadeout(4000)
-                self.rect.x += 2
-                game.screen.blit(self.image, self.rect)
-            if self.rect.x > -100 and self.direction == -1:
-                self.mysteryEntered.fadeout(4000)
-                self.rect.x -= 2
-                game.screen.blit(self.image, self.rect)
-        if self.rect.x > 830:
-            self.playSound = True
-            self.direction = -1
-            resetTimer = True
-        if self.rect.x < -90:
-            self.playSound = True
-            self.direction = 1
-            resetTimer = True
-        if passed > self.moveTime and resetTimer:
-            self.timer = currentTime
-
-
-class EnemyExplosion(sprite.Sprite):
-    def __init__(self, enemy, *groups):
-        super(EnemyExplosion, self).__init__(*groups)
-        self.image = transform.scale(self.get_image(enemy.row), (40, 35))
-        self.image2 = transform.scale(self.get_image(enemy.row), (50, 45))
-        self.rect = self.image.get_rect(topleft=(enemy.rect.x, enemy.rect.y))
-        self.timer = time.get_ticks()
-
-    @staticmethod
-    def get_image(row):
-        img_colors = ['purple', 'blue', 'blue', 'green', 'green']
-        return IMAGES['explosion{}'.format(img_colors[row])]
-
-    def update(self, current_time, *args):
-        passed = current_time - self.timer
-        if passed <= 100:
-            game.screen.blit(self.image, self.rect)
-        elif passed <= 200:
-            game.screen.blit(self.image2, (self.rect.x - 6, self.rect.y - 6))
-        elif 400 < passed:
-            self.kill()
-
-
-class MysteryExplosion(sprite.Sprite):
-    def __init__(self, mystery, score, *groups):
-        super(MysteryExplosion, self).__init__(*groups)
-        self.text = Text(FONT, 20, str(score), WHITE, mystery.rect.x + 20, mystery.rect.y + 6)
-        self.timer = time.get_ticks()
-
-    def update(self, current_time, *args):
-        passed = current_time - self.timer
-        if passed <= 200 or 400 < passed <= 600:
-            self.text.draw(game.screen)
-        elif 600 < passed:
-            self.kill()
-
-
-class ShipExplosion(sprite.Sprite):
-    def __init__(self, ship, *groups):
-        super(ShipExplosion, self).__init__(*groups)
-        self.image = IMAGES['ship']
-        self.rect = self.image.get_rect(topleft=(ship.rect.x, ship.rect.y))
-        self.timer = time.get_ticks()
-
-    def update(self, current_time, *args):
-        passed = current_time - self.timer
-        if 300 < passed <= 600:
-            game.screen.blit(self.image, self.rect)
-        elif 900 < passed:
-            self.kill()
+class Menu(object):
+    def __init__(self, buttons, texts=()):
+        self.buttons = buttons
+        self.texts = list(texts)
+        self.background = None
+        self.base = None
+        self.fullRedraw = True
+
+    def set_texts(self, texts):
+        self.texts = list(texts)
+        self.base = None
+
+    def invalidate(self):
+        self.fullRedraw = True
+
+    def draw(self, screen, background, mouse_pos):
+        if background is not self.background or self.base is None:
+            self.background = background
+            self.base = screen.copy()
+            self.base.blit(background, (0, 0))
+            for text in self.texts:
+                text.draw(self.base)
+            self.fullRedraw = True
+        changed = [button for button in self.buttons if button.check_hover(mouse_pos)]
+        if self.fullRedraw:
+            self.fullRedraw = False
+            screen.blit(self.base, (0, 0))
+            for button in self.buttons:
+                button.draw(screen)
+            return None
+        for button in changed:
+            screen.blit(self.base, button.rect, button.rect)
+            button.draw(screen)
+        return [button.rect for button in changed]
 
 
 class Life(sprite.Sprite):
     def __init__(self, xpos, ypos):
         sprite.Sprite.__init__(self)
-        self.image = IMAGES['ship']
-        self.image = transform.scale(self.image, (23, 23))
+        self.image = IMAGES.scaled('ship', (23, 23))
         self.rect = self.image.get_rect(topleft=(xpos, ypos))
 
-    def update(self, *args):
-        game.screen.blit(self.image, self.rect)
+    def draw(self, surface):
+        surface.blit(self.image, self.rect)
 
 
 class Text(object):
     def __init__(self, textFont, size, message, color, xpos, ypos):
-        self.font = font.Font(textFont, size)
-        self.surface = self.font.render(message, True, color)
+        self.surface = render_text(textFont, size, message, color)
         self.rect = self.surface.get_rect(topleft=(xpos, ypos))
 
     def draw(self, surface):
@@ -343,20 +108,26 @@ class Text(object):
 class Pause:
     def __init__(self):
         self.paused = False
-        font = pygame.font.Font(FONT, 48)
-        self.pause_text = font.render("Pause", True, WHITE)
+        self.pause_text = render_text(FONT, 48, "Pause", WHITE)
+        self.overlay = None
+        self.frame = None
 
     def toggle_pause(self):
         self.paused = not self.paused
 
+    def freeze(self, screen):
+        if self.overlay is None:
+            self.overlay = pygame.Surface(screen.get_size())
+            self.overlay.set_alpha(128)
+            self.overlay.fill((0, 0, 0))
+        self.frame = screen.copy()
+        self.frame.blit(self.overlay, (0, 0))
+        self.frame.blit(self.pause_text, self.pause_text.get_rect(center=self.frame.get_rect().center))
+        return self.frame
+
     def draw(self, screen):
-        if self.paused:
-            overlay = pygame.Surface((800, 600))
-            overlay.set_alpha(128)
-            overlay.fill((0, 0, 0))
-            screen.blit(overlay, (0, 0))
-            text_rect = self.pause_text.get_rect(center=(400, 300))
-            screen.blit(self.pause_text, text_rect)
+        if self.paused and self.frame is not None:
+            screen.blit(self.frame, (0, 0))
 
     def handle_event(self, event):
         if event.type == KEYDOWN:
@@ -365,41 +136,63 @@ class Pause:
 
 
 class SpaceInvaders(object):
-    def __init__(self):
+    def __init__(self, speed=1, seed=None, dirty=True, profile=False, exporter=None, recorder=None, replay=None,
+                 replay_start=0, player=None, waves=DEFAULT_WAVES, measure_startup=False, leaderboard=None):
+        self.measureStartup = measure_startup
+        self.startupTimes = [('imports', perf_counter())]
         mixer.pre_init(44100, -16, 1, 4096)
         init()
+        # Decoding starts before the window opens; the menu only waits for its background, the rest for a game.
+        self.menuAssets = IMAGES.preload(IMAGES.backgroundNames[:1])
+        self.gameAssets = IMAGES.preload() + preload_sounds()
         self.clock = time.Clock()
+        self.screen = display.set_mode(SCREEN_SIZE)
         self.caption = display.set_caption('Space Invaders')
-        self.screen = screen
-        self.backgrounds = [
-            image.load(IMAGE_PATH + "background.jpg").convert(),
-            image.load(IMAGE_PATH + "background1.jpg").convert(),
-            image.load(IMAGE_PATH + "background2.jpg").convert(),
-        ]
+        IMAGES.convert()
+        self.startupTimes.append(('window', perf_counter()))
+        self.renderer = DirtyRenderer(self.screen, dirty)
+        self.staticLayer = StaticLayer(self.screen.copy())
+        self.waves = waves
+        self.formationCache = FormationCache(IMAGES.scaled)
+        self.atlas = SpriteAtlas()
         self.current_background_image_index = 0
-        self.background = self.backgrounds[self.current_background_image_index]
         self.startGame = False
         self.mainScreen = True
         self.settingsScreen = False
         self.gameOver = False
         self.pause = Pause()
-        self.enemyPosition = ENEMY_DEFAULT_POSITION
-        self.shipAlive = False
-        self.wave = 1
         self.volume = 0.5
         self.difficulty = 1
+        self.speed = speed
+        self.seed = seed
+        self.sim = Simulation(self.difficulty, self.seed, self.waves)
+        self.accumulator = 0.0
+        self.fireRequested = False
+        self.gameOverTimer = 0
+        self.exporter = exporter
+        self.recorder = recorder
+        self.replay = replay
+        self.replayStart = replay_start
+        self.profiler = FrameProfiler.from_environment()
+        if profile and not self.profiler.enabled:
+            self.profiler.toggle()
+        self.player = player
+        self.leaderboard = leaderboard if leaderboard is not None else Leaderboard()
+        self.highScores = self.leaderboard.scores(self.difficulty)
+        self.sounds = None
 
         self.titleText = Text(FONT, 50, 'Space Invaders', WHITE, 164, 155)
         self.highScoreText = Text(FONT, 25, 'High Scores', WHITE, 300, 50)
         self.gameOverText = Text(FONT, 50, 'Game Over', WHITE, 250, 270)
         self.nextRoundText = Text(FONT, 50, 'Next Round', WHITE, 240, 270)
+        self.loadingText = Text(FONT, 30, 'Loading', WHITE, 320, 270)
         self.scoreText = Text(FONT, 20, 'Score', WHITE, 5, 5)
         self.livesText = Text(FONT, 20, 'Lives ', WHITE, 640, 5)
+        self.waveText = Text(FONT, 20, 'Wave 1', WHITE, 350, 5)
+        self.waveTextNumber = 1
+        self.scoreNumber = NumberText(FONT, 20, GREEN, 85, 5)
 
-        self.life1 = Life(715, 3)
-        self.life2 = Life(742, 3)
-        self.life3 = Life(769, 3)
-        self.livesGroup = sprite.Group(self.life1, self.life2, self.life3)
+        self.lives = []
 
         self.startButton = Button("Start", (300, 300), (200, 60), self.start_game)
         self.settingsButton = Button("Settings", (300, 380), (200, 60), self.show_settings)
@@ -414,90 +207,99 @@ class SpaceInvaders(object):
         self.backgroundPrevButton = Button("<", (350, 420), (50, 50), self.prev_background)
 
         self.buttons = [self.startButton, self.settingsButton, self.exitButton]
+        self.mainMenu = Menu(self.buttons, [self.titleText])
+        self.settingsMenu = Menu([self.backButton, self.volumeUpButton, self.volumeDownButton, self.difficultyUpButton,
+                                  self.difficultyDownButton, self.backgroundNextButton])
+        self.settingsValues = None
+        self.activeMenu = None
+
+        self.wait_for_assets(self.menuAssets)
+        self.background = IMAGES[IMAGES.backgroundNames[self.current_background_image_index]]
+        self.startupTimes.append(('menu assets', perf_counter()))
+
+    def wait_for_assets(self, futures):
+        done = sum(future.done() for future in futures)
+        if done == len(futures):
+            return
+        while done < len(futures):
+            for e in event.get():
+                if self.should_exit(e):
+                    sys.exit()
+            self.draw_loading(done, len(futures))
+            self.clock.tick(LOADING_FPS)
+            done = sum(future.done() for future in futures)
+        self.activeMenu = None
+        self.renderer.invalidate()
+        self.clock.tick()
+
+    def draw_loading(self, done, total):
+        self.screen.fill((0, 0, 0))
+        self.loadingText.draw(self.screen)
+        draw.rect(self.screen, WHITE, LOADING_BAR, 2)
+        progress = LOADING_BAR.inflate(-8, -8)
+        progress.width = progress.width * done // total
+        draw.rect(self.screen, GREEN, progress)
+        display.update()
+        if self.exporter is not None:
+            self.exporter.publish(self.screen)
+
+    def load_game_assets(self):
+        if self.gameAssets is not None:
+            self.wait_for_assets(self.gameAssets)
+            self.gameAssets = None
+            IMAGES.prebuild()
+            self.create_audio()
+            self.lives = [Life(715 + 27 * index, 3) for index in range(3)]
+        IMAGES.prebuild(WAVES[self.waves].scaled_images())
+        self.atlas.add(IMAGES.scaled_images())
+
+    def report_startup(self):
+        firstFrame = perf_counter()
+        wait_futures(self.gameAssets or [])
+        allLoaded = perf_counter()
+        times = [('start', STARTED)] + self.startupTimes
+        steps = ', '.join('{} {:.0f} ms'.format(name, (end - start) * 1000)
+                          for (_, start), (name, end) in zip(times, times[1:]))
+        print('first menu frame after {:.0f} ms ({}, first frame {:.0f} ms), all assets decoded after {:.0f} ms'.format(
+            (firstFrame - STARTED) * 1000, steps, (firstFrame - times[-1][1]) * 1000, (allLoaded - STARTED) * 1000))
 
     def next_background(self):
-        self.current_background_image_index = (self.current_background_image_index + 1) % len(self.backgrounds)
-        self.background = self.backgrounds[self.current_background_image_index]
+        self.current_background_image_index = (self.current_background_image_index + 1) % len(IMAGES.backgroundNames)
+        self.background = IMAGES[IMAGES.backgroundNames[self.current_background_image_index]]
 
     def prev_background(self):
-        self.current_background_image_index = (self.current_background_image_index - 1) % len(self.backgrounds)
-        self.background = self.backgrounds[self.current_background_image_index]
-
-    def load_scores(self):
-        try:
-            with open('scores.txt', 'r') as f:
-                return json.load(f)
-        except:
-            return [0, 0, 0, 0, 0]
-
-    def save_scores(self, score):
-        scores = self.load_scores()
-        scores.append(score)
-        scores = sorted(scores, reverse=True)[:5]
-        with open('scores.txt', 'w') as f:
-            json.dump(scores, f)
-        return scores
-
-    def reset(self, score):
-        self.player = Ship()
-        self.playerGroup = sprite.Group(self.player)
-        self.explosionsGroup = sprite.Group()
-        self.bullets = sprite.Group()
-        self.mysteryShip = Mystery()
-        self.mysteryGroup = sprite.Group(self.mysteryShip)
-        self.enemyBullets = sprite.Group()
-        self.make_enemies()
-        self.allSprites = sprite.Group(self.player, self.enemies, self.livesGroup, self.mysteryShip)
-        self.keys = key.get_pressed()
-        self.timer = time.get_ticks()
-        self.noteTimer = time.get_ticks()
-        self.shipTimer = time.get_ticks()
-        self.score = score
-        self.create_audio()
-        self.makeNewShip = False
-        self.shipAlive = True
-        self.waveText = Text(FONT, 20, f'Wave {self.wave}', WHITE, 350, 5)
-        self.background = self.backgrounds[self.current_background_image_index]
-
-    def make_blockers(self, number):
-        blockerGroup = sprite.Group()
-        for row in range(4):
-            for column in range(9):
-                blocker = Blocker(10, GREEN, row, column)
-                blocker.rect.x = 50 + (200 * number) + (column * blocker.width)
-                blocker.rect.y = BLOCKERS_POSITION + (row * blocker.height)
-                blockerGroup.add(blocker)
-        return blockerGroup
+        self.current_background_image_index = (self.current_background_image_index - 1) % len(IMAGES.backgroundNames)
+        self.background = IMAGES[IMAGES.backgroundNames[self.current_background_image_index]]
 
     def create_audio(self):
-        self.sounds = {}
-        for sound_name in ['shoot', 'shoot2', 'invaderkilled', 'mysterykilled', 'shipexplosion']:
-            self.sounds[sound_name] = mixer.Sound(SOUND_PATH + '{}.wav'.format(sound_name))
-            self.sounds[sound_name].set_volume(self.volume)
-        self.musicNotes = [mixer.Sound(SOUND_PATH + '{}.wav'.format(i)) for i in range(4)]
-        for sound in self.musicNotes:
-            sound.set_volume(self.volume)
-        self.noteIndex = 0
-
-    def play_main_music(self, currentTime):
-        if currentTime - self.noteTimer > self.enemies.moveTime:
-            self.note = self.musicNotes[self.noteIndex]
-            if self.noteIndex < 3:
-                self.noteIndex += 1
-            else:
-                self.noteIndex = 0
-            self.note.play()
-            self.noteTimer += self.enemies.moveTime
+        self.sounds = get_sound_bank()
+        self.sounds.set_volume(self.volume)
+
+    def play_sounds(self):
+        for action, name in self.sim.events:
+            if action == 'play':
+                self.sounds.play(name)
+            elif action == 'fadeout':
+                self.sounds.fadeout(name, 4000)
+            elif action == 'stop':
+                self.sounds.stop(name)
+        del self.sim.events[:]
 
     @staticmethod
     def should_exit(evt):
         return evt.type == QUIT or (evt.type == KEYUP and evt.key == K_ESCAPE)
 
     def start_game(self):
-        self.allBlockers = sprite.Group(self.make_blockers(0), self.make_blockers(1),
-                                        self.make_blockers(2), self.make_blockers(3))
-        self.livesGroup.add(self.life1, self.life2, self.life3)
-        self.reset(0)
+        self.load_game_assets()
+        if self.replay is not None:
+            self.sim = self.replay.seek(self.replayStart)
+        else:
+            self.sim = Simulation(self.difficulty, self.seed, self.waves)
+            self.sim.start()
+        if self.recorder is not None:
+            self.recorder.begin(self.sim, {'speed': self.speed, 'volume': self.volume})
+        self.accumulator = 0.0
+        self.fireRequested = False
         self.startGame = True
         self.mainScreen = False
         self.settingsScreen = False
@@ -512,19 +314,15 @@ class SpaceInvaders(object):
 
     def increase_volume(self):
         if self.volume < 1.0:
-            self.volume += 0.1
-            for sound in self.sounds.values():
-                sound.set_volume(self.volume)
-            for note in self.musicNotes:
-                note.set_volume(self.volume)
+            self.volume = round(self.volume + 0.1, 1)
+            if self.sounds is not None:
+                self.sounds.set_volume(self.volume)
 
     def decrease_volume(self):
         if self.volume > 0.0:
-            self.volume -= 0.1
-            for sound in self.sounds.values():
-                sound.set_volume(self.volume)
-            for note in self.musicNotes:
-                note.set_volume(self.volume)
+            self.volume = round(self.volume - 0.1, 1)
+            if self.sounds is not None:
+                self.sounds.set_volume(self.volume)
 
     def increase_difficulty(self):
         if self.difficulty < 3:
@@ -537,224 +335,265 @@ class SpaceInvaders(object):
     def check_input(self):
         self.keys = key.get_pressed()
         for e in event.get():
-            if self.should_exit(e):
-                sys.exit()
-            self.pause.handle_event(e)
+            self.handle_event(e)
+
+    def handle_event(self, e):
+        if self.should_exit(e):
+            sys.exit()
+        self.pause.handle_event(e)
+        if self.pause.paused:
+            return
 
-            if e.type == MOUSEBUTTONDOWN and e.button == 1:
-                pos = pygame.mouse.get_pos()
-                if self.mainScreen:
-                    for button in self.buttons:
-                        button.click()
-                elif self.settingsScreen:
-                    self.backButton.click()
-                    self.volumeUpButton.click()
-                    self.volumeDownButton.click()
-                    self.difficultyUpButton.click()
-                    self.difficultyDownButton.click()
-                    self.backgroundNextButton.click()
-                    self.backgroundPrevButton.click()
-
-            if e.type == KEYDOWN:
-                if e.key == K_SPACE and self.startGame and self.shipAlive and not self.pause.paused:
-                    if len(self.bullets) == 0:
-                        if self.score < 1000:
-                            bullet = Bullet(self.player.rect.x + 23, self.player.rect.y + 5, -1, 15, 'laser', 'center')
-                            self.bullets.add(bullet)
-                            self.allSprites.add(self.bullets)
-                            self.sounds['shoot'].play()
-                        else:
-                            leftbullet = Bullet(self.player.rect.x + 8, self.player.rect.y + 5, -1, 15, 'laser', 'left')
-                            rightbullet = Bullet(self.player.rect.x + 38, self.player.rect.y + 5, -1, 15, 'laser',
-                                                 'right')
-                            self.bullets.add(leftbullet)
-                            self.bullets.add(rightbullet)
-                            self.allSprites.add(self.bullets)
-                            self.sounds['shoot2'].play()
-
-    def make_enemies(self):
-        enemies = EnemiesGroup(10, 5)
-        for row in range(5):
-            for column in range(10):
-                enemy = Enemy(row, column)
-                enemy.rect.x = 157 + (column * 50)
-                enemy.rect.y = self.enemyPosition + (row * 45)
-                enemies.add(enemy)
-        self.enemies = enemies
-        self.enemies.moveTime = 600 // self.difficulty
-
-    def make_enemies_shoot(self):
-        if (time.get_ticks() - self.timer) > (700 // self.difficulty) and self.enemies:
-            enemy = self.enemies.random_bottom()
-            self.enemyBullets.add(Bullet(enemy.rect.x + 14, enemy.rect.y + 20, 1, 5, 'enemylaser', 'center'))
-            self.allSprites.add(self.enemyBullets)
-            self.timer = time.get_ticks()
-
-    def calculate_score(self, row):
-        scores = {0: 30, 1: 20, 2: 20, 3: 10, 4: 10, 5: choice([50, 100, 150, 300])}
-        score = scores[row]
-        self.score += score
-        return score
-
-    def check_collisions(self):
-        sprite.groupcollide(self.bullets, self.enemyBullets, True, True)
-        for enemy in sprite.groupcollide(self.enemies, self.bullets, True, True).keys():
-            self.sounds['invaderkilled'].play()
-            self.calculate_score(enemy.row)
-            EnemyExplosion(enemy, self.explosionsGroup)
-            self.gameTimer = time.get_ticks()
-        for mystery in sprite.groupcollide(self.mysteryGroup, self.bullets, True, True).keys():
-            mystery.mysteryEntered.stop()
-            self.sounds['mysterykilled'].play()
-            score = self.calculate_score(mystery.row)
-            MysteryExplosion(mystery, score, self.explosionsGroup)
-            newShip = Mystery()
-            self.allSprites.add(newShip)
-            self.mysteryGroup.add(newShip)
-        for player in sprite.groupcollide(self.playerGroup, self.enemyBullets, True, True).keys():
-            if self.life3.alive():
-                self.life3.kill()
-            elif self.life2.alive():
-                self.life2.kill()
-            elif self.life1.alive():
-                self.life1.kill()
+        if e.type == MOUSEBUTTONDOWN and e.button == 1:
+            if self.mainScreen:
+                for button in self.buttons:
+                    button.click()
+            elif self.settingsScreen:
+                self.backButton.click()
+                self.volumeUpButton.click()
+                self.volumeDownButton.click()
+                self.difficultyUpButton.click()
+                self.difficultyDownButton.click()
+                self.backgroundNextButton.click()
+                self.backgroundPrevButton.click()
+
+        if e.type == KEYDOWN:
+            if e.key == K_SPACE and self.startGame:
+                self.fireRequested = True
+            elif e.key == K_F3:
+                self.profiler.toggle()
+            elif e.key == K_F4 and self.profiler.count:
+                print('Profile written to ' + self.profiler.dump())
+
+    def update_game(self, elapsed):
+        self.accumulator = min(self.accumulator + elapsed * self.speed,
+                               TICK_MS * MAX_TICKS_PER_FRAME * self.speed)
+        while self.accumulator >= TICK_MS:
+            # Checked before reading input too: a replay sought to its end has no input left for this tick.
+            if self.game_finished():
+                self.finish_game()
+                break
+            self.accumulator -= TICK_MS
+            if self.replay is not None:
+                left, right, fire = self.replay.input(self.sim.tick)
             else:
-                self.gameOver = True
-                self.startGame = False
-            self.sounds['shipexplosion'].play()
-            ShipExplosion(player, self.explosionsGroup)
-            self.makeNewShip = True
-            self.shipTimer = time.get_ticks()
-            self.shipAlive = False
-        if self.enemies.bottom >= 540:
-            sprite.groupcollide(self.enemies, self.playerGroup, True, True)
-            if not self.player.alive() or self.enemies.bottom >= 600:
-                self.gameOver = True
-                self.startGame = False
-        sprite.groupcollide(self.bullets, self.allBlockers, True, True)
-        sprite.groupcollide(self.enemyBullets, self.allBlockers, True, True)
-        if self.enemies.bottom >= BLOCKERS_POSITION:
-            sprite.groupcollide(self.enemies, self.allBlockers, False, True)
-
-    def create_new_ship(self, createShip, currentTime):
-        if createShip and (currentTime - self.shipTimer > 900):
-            self.player = Ship()
-            self.allSprites.add(self.player)
-            self.playerGroup.add(self.player)
-            self.makeNewShip = False
-            self.shipAlive = True
+                left, right, fire = self.keys[K_LEFT], self.keys[K_RIGHT], self.fireRequested
+            self.sim.step(left, right, fire)
+            if self.recorder is not None:
+                self.recorder.record(self.sim, left, right, fire)
+            self.fireRequested = False
+            if self.game_finished():
+                self.finish_game()
+                break
+        self.play_sounds()
+
+    def game_finished(self):
+        return self.sim.gameOver or (self.replay is not None and self.sim.tick >= self.replay.last_tick)
+
+    def finish_game(self):
+        self.startGame = False
+        self.gameOver = True
+        self.gameOverTimer = time.get_ticks()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.replay is None and self.sim.waves.ranked:
+            sim = self.sim
+            self.highScores = self.leaderboard.submit(sim.score, sim.difficulty, sim.wave, sim.tick, sim.seed,
+                                                      self.player)
+
+    def static_items(self, between_waves):
+        if self.waveTextNumber != self.sim.wave:
+            self.waveTextNumber = self.sim.wave
+            self.waveText = Text(FONT, 20, f'Wave {self.sim.wave}', WHITE, 350, 5)
+        items = []
+        if not between_waves:
+            items.extend((bunker.image, bunker.rect, bunker.version) for bunker in self.sim.bunkers)
+        for text in (self.scoreText, self.waveText, self.livesText):
+            items.append((text.surface, text.rect, 0))
+        items.extend((life.image, life.rect, 0) for life in self.lives[:self.sim.lives])
+        if between_waves:
+            items.append((self.nextRoundText.surface, self.nextRoundText.rect, 0))
+        return items
+
+    def draw_game(self):
+        sim = self.sim
+        betweenWaves = sim.between_waves()
+        # Background, bunkers and HUD labels only change on hits, lives and waves, so they live in one cached layer.
+        changed = self.staticLayer.compose(self.background, self.static_items(betweenWaves))
+        self.renderer.begin(self.staticLayer.surface, changed)
+        self.scoreNumber.draw(self.renderer, sim.score)
+        if betweenWaves:
+            return
+        if sim.enemies:
+            self.renderer.blit(self.formationCache.surface(sim.enemies), (sim.enemies.x, sim.enemies.y))
+        # Ships, bullets, the mystery ship and explosions all come from the atlas and go out in one blits call.
+        sprites = [(entity.image, entity.rect) for entity in sim.allSprites if entity.visible]
+        for explosion in sim.explosionsGroup:
+            if not explosion.visible:
+                continue
+            if isinstance(explosion, MysteryExplosion):
+                sprites.append((render_text(FONT, 20, str(explosion.score), WHITE), explosion.position))
+            else:
+                sprites.append((explosion.image, explosion.rect))
+        self.renderer.blits(self.atlas.blits(sprites))
+
+    def draw_menu(self, menu, mouse_pos):
+        if menu is not self.activeMenu:
+            self.activeMenu = menu
+            menu.invalidate()
+        return menu.draw(self.screen, self.background, mouse_pos)
+
+    def draw_main_menu(self, mouse_pos):
+        return self.draw_menu(self.mainMenu, mouse_pos)
+
+    def draw_settings(self, mouse_pos):
+        values = (self.volume, self.difficulty)
+        if values != self.settingsValues:
+            self.settingsValues = values
+            self.settingsMenu.set_texts([Text(FONT, 10, f"Volume: {int(self.volume * 100)}%", WHITE, 200, 310),
+                                         Text(FONT, 10, f"Difficulty: {self.difficulty}", WHITE, 200, 370)])
+        return self.draw_menu(self.settingsMenu, mouse_pos)
 
     def create_game_over(self, currentTime):
-        self.screen.blit(self.background, (0, 0))
-        scores = self.save_scores(self.score)
-        passed = currentTime - self.timer
+        self.renderer.begin(self.background)
+        passed = currentTime - self.gameOverTimer
 
         if passed < 750:
-            self.gameOverText.draw(self.screen)
+            self.gameOverText.draw(self.renderer)
         elif 750 < passed < 1500:
-            self.screen.blit(self.background, (0, 0))
-            self.highScoreText.draw(self.screen)
-            for i, score in enumerate(scores):
+            self.highScoreText.draw(self.renderer)
+            for i, score in enumerate(self.highScores):
                 score_text = Text(FONT, 20, f"{i + 1}. {score}", WHITE, 350, 100 + i * 30)
-                score_text.draw(self.screen)
+                score_text.draw(self.renderer)
         elif 1500 < passed < 2250:
-            self.gameOverText.draw(self.screen)
-        elif 2250 < passed < 2750:
-            self.screen.blit(self.background, (0, 0))
+            self.gameOverText.draw(self.renderer)
         elif passed > 3000:
             self.mainScreen = True
             self.gameOver = False
-            self.wave = 1
+
+    def wait_paused(self):
+        pausedAt = time.get_ticks()
+        if self.recorder is not None and self.startGame:
+            self.recorder.mark_pause()
+        self.pause.freeze(self.screen)
+        self.pause.draw(self.screen)
+        display.update()
+        if self.exporter is not None:
+            self.exporter.publish(self.screen)
+        while self.pause.paused:
+            e = event.wait()
+            if self.should_exit(e):
+                sys.exit()
+            self.pause.handle_event(e)
+            if e.type in (VIDEOEXPOSE, WINDOWEXPOSED):
+                display.update()
+        # Nothing ran while paused, so only wall-clock timers move and the next frame must not catch up.
+        self.gameOverTimer += time.get_ticks() - pausedAt
+        self.fireRequested = False
+        self.activeMenu = None
+        self.renderer.invalidate()
+        self.clock.tick()
 
     def main(self):
         while True:
+            elapsed = self.clock.tick(60)
             currentTime = time.get_ticks()
+            profiler = self.profiler if self.profiler.enabled else None
+            if profiler is not None:
+                profiler.clock.start()
             self.check_input()
-            mouse_pos = pygame.mouse.get_pos()
-
             if self.pause.paused:
-                self.screen.blit(self.background, (0, 0))
-                if self.startGame:
-                    self.allBlockers.update(self.screen)
-                    self.scoreText2 = Text(FONT, 20, str(self.score), GREEN, 85, 5)
-                    self.scoreText.draw(self.screen)
-                    self.scoreText2.draw(self.screen)
-                    self.waveText.draw(self.screen)
-                    self.livesText.draw(self.screen)
-                    self.allSprites.update(self.keys, currentTime)
-                    self.explosionsGroup.update(currentTime)
-                self.pause.draw(self.screen)
-                display.update()
-                self.clock.tick(60)
+                self.wait_paused()
                 continue
+            mouse_pos = pygame.mouse.get_pos()
+            self.sim.phaseClock = profiler.clock if profiler is not None else None
+            if profiler is not None:
+                profiler.clock.lap('check_input')
 
+            playing = False
+            retained = False
+            dirtyRects = None
             if self.mainScreen:
-                self.screen.blit(self.background, (0, 0))
-                self.titleText.draw(self.screen)
-                for button in self.buttons:
-                    button.check_hover(mouse_pos)
-                    button.draw(self.screen)
+                dirtyRects = self.draw_main_menu(mouse_pos)
 
             elif self.settingsScreen:
-                self.screen.blit(self.background, (0, 0))
-                volume_text = Text(FONT, 10, f"Volume: {int(self.volume * 100)}%", WHITE, 200, 310)
-                difficulty_text = Text(FONT, 10, f"Difficulty: {self.difficulty}", WHITE, 200, 370)
-                volume_text.draw(self.screen)
-                difficulty_text.draw(self.screen)
-                self.backButton.check_hover(mouse_pos)
-                self.backButton.draw(self.screen)
-                self.volumeUpButton.check_hover(mouse_pos)
-                self.volumeUpButton.draw(self.screen)
-                self.volumeDownButton.check_hover(mouse_pos)
-                self.volumeDownButton.draw(self.screen)
-                self.difficultyUpButton.check_hover(mouse_pos)
-                self.difficultyUpButton.draw(self.screen)
-                self.difficultyDownButton.check_hover(mouse_pos)
-                self.difficultyDownButton.draw(self.screen)
-                self.backgroundNextButton.check_hover(mouse_pos)
-                self.backgroundNextButton.draw(self.screen)
+                dirtyRects = self.draw_settings(mouse_pos)
 
             elif self.startGame:
-                if not self.enemies and not self.explosionsGroup:
-                    if currentTime - self.gameTimer < 3000:
-                        self.screen.blit(self.background, (0, 0))
-                        self.scoreText2 = Text(FONT, 20, str(self.score), GREEN, 85, 5)
-                        self.scoreText.draw(self.screen)
-                        self.scoreText2.draw(self.screen)
-                        self.waveText.draw(self.screen)
-                        self.nextRoundText.draw(self.screen)
-                        self.livesText.draw(self.screen)
-                        self.livesGroup.update()
-                    elif currentTime - self.gameTimer > 3000:
-                        self.wave += 1
-                        self.waveText = Text(FONT, 20, f'Wave {self.wave}', WHITE, 350, 5)
-                        self.enemyPosition += ENEMY_MOVE_DOWN
-                        self.reset(self.score)
-                        self.gameTimer += 3000
-                else:
-                    self.screen.blit(self.background, (0, 0))
-                    self.play_main_music(currentTime)
-                    self.allBlockers.update(self.screen)
-                    self.scoreText2 = Text(FONT, 20, str(self.score), GREEN, 85, 5)
-                    self.scoreText.draw(self.screen)
-                    self.scoreText2.draw(self.screen)
-                    self.waveText.draw(self.screen)
-                    self.livesText.draw(self.screen)
-                    self.enemies.update(currentTime)
-                    self.allSprites.update(self.keys, currentTime)
-                    self.explosionsGroup.update(currentTime)
-                    self.check_collisions()
-                    self.create_new_ship(self.makeNewShip, currentTime)
-                    self.make_enemies_shoot()
+                self.update_game(elapsed)
+                if profiler is not None:
+                    profiler.clock.lap('audio')
+                self.draw_game()
+                self.activeMenu = None
+                playing = retained = True
 
             elif self.gameOver:
-                self.enemyPosition = ENEMY_DEFAULT_POSITION
                 self.create_game_over(currentTime)
+                self.activeMenu = None
+                retained = True
+
+            if profiler is not None:
+                profiler.clock.lap('drawing')
+                overlay = profiler.surface()
+                profiler.clock.lap('profiler')
+                if retained:
+                    self.renderer.blit(overlay, OVERLAY_POSITION, version=profiler.frames)
+                else:
+                    self.screen.blit(overlay, OVERLAY_POSITION)
+                    self.activeMenu = None
+                    dirtyRects = None
 
-            display.update()
-            self.clock.tick(60)
+            if retained:
+                dirtyRects = self.renderer.render()
+            else:
+                self.renderer.invalidate()
+            if profiler is not None:
+                profiler.clock.lap('drawing')
+            self.renderer.flip(dirtyRects)
+            if self.exporter is not None:
+                self.exporter.publish(self.screen)
+            if profiler is not None:
+                profiler.clock.lap('display.update')
+                profiler.end_frame(currentTime, elapsed, self.sim if self.startGame or playing else None)
+            if self.measureStartup:
+                self.report_startup()
+                return
+
+            if self.activeMenu is not None:
+                # Menus only change on input, so sleep until the next event instead of spinning at 60 fps.
+                self.handle_event(event.wait())
+                self.clock.tick()
 
 
 if __name__ == '__main__':
-    game = SpaceInvaders()
+    parser = argparse.ArgumentParser(description='Space Invaders')
+    parser.add_argument('--speed', type=float, default=1, help='simulation speed multiplier')
+    parser.add_argument('--seed', type=int, default=None, help='seed for every new game')
+    parser.add_argument('--full-redraw', action='store_true', help='redraw the whole screen every frame')
+    parser.add_argument('--profile', action='store_true', help='start with the frame profiler on (F3 toggles it)')
+    parser.add_argument('--export-frames', nargs='?', const='', default=None, metavar='NAME',
+                        help='publish every frame to a shared memory ring, see framebuffer.py')
+    parser.add_argument('--export-scale', type=int, default=1, help='downscale exported frames by this factor')
+    parser.add_argument('--export-gray', action='store_true', help='export single channel grayscale frames')
+    parser.add_argument('--record', metavar='PATH', help='record every game to this replay file, strftime codes allowed')
+    parser.add_argument('--replay', metavar='PATH', help='watch a recorded replay instead of playing')
+    parser.add_argument('--seek', type=float, default=0, help='start the replay at this many seconds')
+    parser.add_argument('--player', default=None, help='name stored with every result on the leaderboard')
+    parser.add_argument('--measure-startup', action='store_true',
+                        help='print the time to the first menu frame and until every asset is decoded, then quit')
+    parser.add_argument('--waves', choices=sorted(WAVES), default=DEFAULT_WAVES,
+                        help='wave set from waves.json, "stress" fills the screen with invaders and bullets')
+    args = parser.parse_args()
+    replay = Replay.load(args.replay) if args.replay else None
+    exporter = None
+    if args.export_frames is not None:
+        exporter = FrameExporter(SCREEN_SIZE, args.export_frames or None, scale=args.export_scale,
+                                 gray=args.export_gray)
+        atexit.register(exporter.close)
+        print('Exporting frames to shared memory ' + exporter.name)
+    game = SpaceInvaders(speed=args.speed, seed=args.seed, dirty=not args.full_redraw, profile=args.profile,
+                         exporter=exporter, recorder=ReplayRecorder(args.record) if args.record else None,
+                         replay=replay, replay_start=int(args.seek * TICK_RATE), player=args.player,
+                         waves=replay.header.get('waves', DEFAULT_WAVES) if replay else args.waves,
+                         measure_startup=args.measure_startup)
     game.main()
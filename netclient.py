@@ -0,0 +1,305 @@
+import os
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import asyncio
+import json
+from collections import deque
+from time import perf_counter
+
+import numpy as np
+import pygame
+from pygame import K_ESCAPE, K_LEFT, K_RIGHT, K_SPACE, KEYDOWN, QUIT, Rect
+
+from assets import IMAGES
+from bots import RandomPolicy
+from config import FONT, GREEN, SCREEN_SIZE, WHITE
+from netplay import (BETWEEN_WAVES, BYE, DEFAULT_PORT, ENEMY_BULLET, ENEMY_EXPLOSION, GAME_OVER, HELLO,
+                     HISTORY_TICKS, INPUT, INPUT_MESSAGE, MODES, MYSTERY_EXPLOSION, PROTOCOL_VERSION, STARTED,
+                     STATE, STATE_HEADER, WELCOME, Server, WorldState, decode_delta, frame, read_frame)
+from render import SpriteAtlas
+from replay import pack_input
+from simulation import TICK_RATE, Ship
+from text import render as render_text
+from waves import DEFAULT_WAVES, EXPLOSION_GROWTH, WAVES
+
+# Past this many pixels a misprediction is a respawn or a lost input burst, not something to smooth over.
+SNAP_DISTANCE = 40
+CORRECTION_DECAY = 0.75
+
+
+class NetClient(object):
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, mode='coop', players=2, difficulty=1,
+                 waves=DEFAULT_WAVES, name=None):
+        self.host = host
+        self.port = port
+        self.hello = {'version': PROTOCOL_VERSION, 'mode': mode, 'players': players, 'difficulty': difficulty,
+                      'waves': waves, 'name': name}
+        self.waveSet = WAVES[waves]
+        self.reader = None
+        self.writer = None
+        self.receiver = None
+        self.welcome = None
+        self.pilot = 0
+        self.raw = {}
+        self.ack = 0
+        self.state = None
+        self.stateTime = 0
+        self.previous = None
+        self.previousTime = 0
+        self.sequence = 0
+        self.pending = deque()
+        self.ship = Ship()
+        self.correction = 0.0
+        self.result = None
+        self.stats = {'states': 0, 'bytes': 0, 'errors': 0, 'error_pixels': 0, 'snaps': 0}
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(frame(HELLO, json.dumps(self.hello).encode()))
+        kind, payload = await read_frame(self.reader)
+        if kind != WELCOME:
+            self.writer.close()
+            raise ConnectionError(json.loads(payload).get('error', 'the server refused the game'))
+        self.welcome = json.loads(payload)
+        self.pilot = self.welcome['pilot']
+        self.receiver = asyncio.create_task(self.receive())
+        return self
+
+    @property
+    def connected(self):
+        return self.receiver is not None and not self.receiver.done()
+
+    async def close(self):
+        if self.connected:
+            self.writer.write(frame(BYE, b''))
+            self.writer.close()
+            await self.receiver
+
+    async def receive(self):
+        try:
+            while True:
+                kind, payload = await read_frame(self.reader)
+                if kind == STATE:
+                    self.stats['bytes'] += len(payload)
+                    self.apply(payload)
+                elif kind == BYE:
+                    self.result = json.loads(payload)
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writer.close()
+
+    def apply(self, payload):
+        tick, baseline, sequence, length = STATE_HEADER.unpack_from(payload)
+        raw = decode_delta(payload[STATE_HEADER.size:], self.raw[baseline] if baseline else b'', length)
+        self.raw[tick] = raw
+        # The server only deltas against acknowledged ticks it still remembers, so older ones are never needed.
+        for old in [old for old in self.raw if old <= tick - HISTORY_TICKS]:
+            del self.raw[old]
+        self.ack = tick
+        self.previous, self.previousTime = self.state, self.stateTime
+        self.state, self.stateTime = WorldState(raw, self.waveSet), perf_counter()
+        self.stats['states'] += 1
+        self.reconcile(sequence)
+
+    def flying(self):
+        state = self.state
+        return (state is not None and state.flags & STARTED and not state.flags & (GAME_OVER | BETWEEN_WAVES) and
+                state.pilots[self.pilot][2])
+
+    def reconcile(self, sequence):
+        while self.pending and self.pending[0][0] <= sequence:
+            self.pending.popleft()
+        xpos, ypos, alive = self.state.pilots[self.pilot]
+        predicted = self.ship.rect.x
+        self.ship.rect.topleft = (xpos, ypos)
+        if self.flying():
+            for _, left, right in self.pending:
+                self.ship.update(0, left, right)
+        error = predicted - self.ship.rect.x
+        if not alive or abs(error) > SNAP_DISTANCE:
+            self.stats['snaps'] += bool(error)
+            self.correction = 0.0
+        else:
+            if error:
+                self.stats['errors'] += 1
+                self.stats['error_pixels'] += abs(error)
+                # The drawn ship keeps its place and eases onto the corrected prediction over the next frames.
+                self.correction += error
+
+    def send_input(self, left, right, fire):
+        if not self.connected:
+            return
+        self.sequence += 1
+        self.pending.append((self.sequence, left, right))
+        if self.flying():
+            self.ship.update(0, left, right)
+        self.correction *= CORRECTION_DECAY
+        self.writer.write(frame(INPUT, INPUT_MESSAGE.pack(self.sequence, self.ack, pack_input(left, right, fire))))
+
+    def own_position(self):
+        return round(self.ship.rect.x + self.correction), self.ship.rect.y
+
+    def pilot_position(self, index, now):
+        # Other ships are drawn one tick in the past, between the last two states the server sent.
+        xpos, ypos, _ = self.state.pilots[index]
+        if self.previous is None or index >= len(self.previous.pilots):
+            return xpos, ypos
+        lastX, lastY, _ = self.previous.pilots[index]
+        span = max(self.stateTime - self.previousTime, 1 / TICK_RATE)
+        blend = min(1.0, (now - self.stateTime) / span)
+        return round(lastX + (xpos - lastX) * blend), round(lastY + (ypos - lastY) * blend)
+
+
+def draw_state(screen, client, background, font, atlas):
+    state = client.state
+    screen.blit(background, (0, 0))
+    if state is None:
+        screen.blit(font.render('Waiting for players', False, WHITE), (260, 280))
+        return
+    wave = client.waveSet.wave(state.wave)
+    screen.blit(font.render('Score {}'.format(state.score), False, WHITE), (5, 5))
+    screen.blit(font.render('Wave {}'.format(state.wave), False, WHITE), (350, 5))
+    screen.blit(font.render('Lives {}'.format(state.lives), False, WHITE), (660, 5))
+    for number, (score, lives, waveNumber, flags) in enumerate(state.opponents):
+        text = 'Rival {}: {} wave {} {}'.format(number + 1, score, waveNumber,
+                                                'out' if flags & GAME_OVER else 'lives {}'.format(lives))
+        screen.blit(font.render(text, False, WHITE), (5, 30 + 20 * number))
+    if state.flags & GAME_OVER:
+        screen.blit(font.render('Game Over', False, WHITE), (330, 280))
+        return
+    if state.flags & BETWEEN_WAVES:
+        screen.blit(font.render('Next Round', False, WHITE), (330, 280))
+        return
+    layout = state.bunkerLayout
+    size = layout.cellSize
+    for (left, top), cells in zip(layout.positions(), state.bunkers):
+        alive = np.unpackbits(np.frombuffer(cells, np.uint8))[:layout.rows * layout.columns]
+        for cell in np.flatnonzero(alive).tolist():
+            row, column = divmod(cell, layout.columns)
+            screen.fill(GREEN, Rect(left + column * size, top + row * size, size, size))
+    enemySize = (wave.width, wave.height)
+    rowImages = [IMAGES.scaled(enemy.images[state.frame], enemySize) for enemy in wave.rowTypes]
+    rows, columns = np.nonzero(state.alive)
+    sprites = [(rowImages[row], (state.enemyX + column * wave.columnWidth, state.enemyY + row * wave.rowHeight))
+               for row, column in zip(rows.tolist(), columns.tolist())]
+    if state.mysteryVisible:
+        sprites.append((IMAGES.scaled('mystery', (75, 35)), (state.mysteryX, 45)))
+    now = perf_counter()
+    for index, (_, _, alive) in enumerate(state.pilots):
+        if alive:
+            position = client.own_position() if index == client.pilot else client.pilot_position(index, now)
+            sprites.append((IMAGES['ship'], position))
+    laser, enemyLaser = IMAGES['laser'], IMAGES['enemylaser']
+    sprites.extend((enemyLaser if kind == ENEMY_BULLET else laser, (xpos, ypos)) for xpos, ypos, kind in state.bullets)
+    for kind, xpos, ypos, stage, detail in state.explosions:
+        if not stage:
+            continue
+        if kind == ENEMY_EXPLOSION:
+            name = wave.rowTypes[detail].explosion
+            if stage == 1:
+                sprites.append((IMAGES.scaled(name, enemySize), (xpos, ypos)))
+            else:
+                grown = (wave.width + EXPLOSION_GROWTH, wave.height + EXPLOSION_GROWTH)
+                sprites.append((IMAGES.scaled(name, grown), (xpos - 6, ypos - 6)))
+        elif kind == MYSTERY_EXPLOSION:
+            sprites.append((render_text(FONT, 16, str(detail), WHITE), (xpos, ypos)))
+        else:
+            sprites.append((IMAGES['ship'], (xpos, ypos)))
+    screen.blits(atlas.blits(sprites), doreturn=False)
+
+
+async def play(args):
+    pygame.init()
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    pygame.display.set_caption('Space Invaders - {} game on {}:{}'.format(args.mode, args.host, args.port))
+    IMAGES.convert()
+    background = IMAGES[IMAGES.backgroundNames[0]]
+    font = pygame.font.Font(FONT, 16)
+    atlas = SpriteAtlas()
+    client = NetClient(args.host, args.port, args.mode, args.players, args.difficulty, args.waves, args.name)
+    screen.blit(background, (0, 0))
+    screen.blit(font.render('Waiting for players', False, WHITE), (260, 280))
+    pygame.display.flip()
+    await client.connect()
+    interval = 1 / TICK_RATE
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    fire = False
+    while client.connected:
+        for e in pygame.event.get():
+            if e.type == QUIT or (e.type == KEYDOWN and e.key == K_ESCAPE):
+                await client.close()
+            elif e.type == KEYDOWN and e.key == K_SPACE:
+                fire = True
+        keys = pygame.key.get_pressed()
+        client.send_input(keys[K_LEFT], keys[K_RIGHT], fire)
+        fire = False
+        draw_state(screen, client, background, font, atlas)
+        pygame.display.flip()
+        deadline += interval
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+    if client.result is not None:
+        print('Final scores: {}'.format(', '.join(map(str, client.result.get('scores', [])))))
+    pygame.quit()
+
+
+async def bench(args):
+    server = await Server('127.0.0.1', 0, args.seed).start()
+    clients = [NetClient('127.0.0.1', server.port, args.mode, args.players, args.difficulty, args.waves,
+                         'bot{}'.format(number))
+               for number in range(args.sessions * args.players)]
+    await asyncio.gather(*(client.connect() for client in clients))
+    policies = [RandomPolicy(seed=number) for number in range(len(clients))]
+    loop = asyncio.get_running_loop()
+    interval = 1 / TICK_RATE
+    start = deadline = loop.time()
+    # One driver feeds every bot, the way a frame loop would, instead of hundreds of competing sleeps.
+    while loop.time() - start < args.seconds and any(client.connected for client in clients):
+        for client, policy in zip(clients, policies):
+            client.send_input(*policy(None))
+        deadline += interval
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+    elapsed = loop.time() - start
+    stats = server.stats
+    await server.close()
+    await asyncio.gather(*(client.receiver for client in clients))
+
+    times = sorted(stats['tick_times'])
+    states = [client.stats['states'] for client in clients]
+    errors = sum(client.stats['errors'] for client in clients)
+    print('{} sessions x {} players ({}), {:.1f} s'.format(args.sessions, args.players, args.mode, elapsed))
+    print('server: {} ticks ({:.1f}/s), tick p50 {:.2f} ms p99 {:.2f} ms, {} overruns, {} states held back'.format(
+        stats['ticks'], stats['ticks'] / elapsed, 1000 * times[len(times) // 2], 1000 * times[len(times) * 99 // 100],
+        stats['overruns'], stats['skipped']))
+    print('states: {} full, {:.0f} bytes avg; {} delta, {:.1f} bytes avg; raw {:.1f} bytes avg'.format(
+        stats['fulls'], stats['full_bytes'] / max(1, stats['fulls']), stats['deltas'],
+        stats['delta_bytes'] / max(1, stats['deltas']),
+        stats['raw_bytes'] / max(1, stats['fulls'] + stats['deltas'])))
+    print('clients: {:.1f} states/s each (min {}, max {}), {:.0f} bytes/s each'.format(
+        sum(states) / len(clients) / elapsed, min(states), max(states),
+        sum(client.stats['bytes'] for client in clients) / len(clients) / elapsed))
+    print('prediction: {} corrections, {:.2f} px mean error, {} snaps to respawns or large errors'.format(
+        errors, sum(client.stats['error_pixels'] for client in clients) / max(1, errors),
+        sum(client.stats['snaps'] for client in clients)))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Play on a Space Invaders multiplayer server, or load test one.')
+    parser.add_argument('command', choices=['play', 'bench'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--mode', choices=MODES, default='coop')
+    parser.add_argument('--players', type=int, default=2, help='players per session')
+    parser.add_argument('--difficulty', type=int, default=1)
+    parser.add_argument('--waves', choices=sorted(WAVES), default=DEFAULT_WAVES)
+    parser.add_argument('--name', default=None)
+    parser.add_argument('--sessions', type=int, default=24, help='bench: sessions played by bots in this process')
+    parser.add_argument('--seconds', type=float, default=10, help='bench: how long to play')
+    parser.add_argument('--seed', type=int, default=0, help='bench: server seed')
+    args = parser.parse_args()
+    asyncio.run(play(args) if args.command == 'play' else bench(args))
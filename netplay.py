@@ -0,0 +1,498 @@
+import os
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import asyncio
+import json
+import struct
+import sys
+import zlib
+from collections import deque
+from itertools import count
+from random import Random
+from time import perf_counter
+
+import numpy as np
+from pygame import sprite
+
+from replay import FIRE, unpack_input
+from simulation import TICK_RATE, EnemyExplosion, MysteryExplosion, Ship, Simulation
+from waves import DEFAULT_WAVES, WAVES
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 7777
+MODES = ['coop', 'versus']
+DIFFICULTIES = [1, 2, 3]
+MAX_PLAYERS = 8
+SHIP_SPACING = 120
+HISTORY_TICKS = TICK_RATE
+MAX_QUEUED_INPUTS = 6
+MAX_WRITE_BUFFER = 64 * 1024
+
+HELLO, WELCOME, INPUT, STATE, BYE = b'h', b'w', b'i', b's', b'b'
+FRAME = struct.Struct('<cH')
+INPUT_MESSAGE = struct.Struct('<IIB')
+STATE_HEADER = struct.Struct('<IIIH')
+
+STARTED, GAME_OVER, BETWEEN_WAVES = 1, 2, 4
+PLAYER_BULLET, ENEMY_BULLET = 0, 1
+ENEMY_EXPLOSION, MYSTERY_EXPLOSION, SHIP_EXPLOSION = 0, 1, 2
+HEADER = struct.Struct('<IiBHBBB')
+PILOT = struct.Struct('<hhB')
+ENEMIES = struct.Struct('<hhBBB')
+MYSTERY = struct.Struct('<hB')
+OPPONENT = struct.Struct('<iBHB')
+BULLET = struct.Struct('<hhB')
+EXPLOSION = struct.Struct('<BhhBH')
+COUNT = struct.Struct('<H')
+
+PILOT_FIELDS = ['player', 'bullets', 'shipAlive', 'makeNewShip', 'shipTimer']
+
+
+class Pilot(object):
+    def __init__(self, index):
+        self.index = index
+        self.left = False
+        self.right = False
+        self.player = None
+        self.bullets = sprite.Group()
+        self.shipAlive = False
+        self.makeNewShip = False
+        self.shipTimer = 0
+
+
+class PilotShip(Ship):
+    def __init__(self, pilot, xpos):
+        Ship.__init__(self)
+        self.pilot = pilot
+        self.rect.x = xpos
+
+    def update(self, current_time, *args):
+        Ship.update(self, current_time, self.pilot.left, self.pilot.right)
+
+
+class CoopSimulation(Simulation):
+    # One formation, bunker set, score and pool of lives shared by several ships. Every pilot keeps its own ship,
+    # bullets and respawn timer, which are swapped into the single player attributes Simulation works on.
+    def __init__(self, pilots=1, difficulty=1, seed=None, waves=DEFAULT_WAVES):
+        self.pilots = [Pilot(index) for index in range(pilots)]
+        self.pilot = self.pilots[0]
+        Simulation.__init__(self, difficulty, seed, waves)
+        self.player = None
+        self.shipTimer = 0
+
+    def fly(self, pilot):
+        for name in PILOT_FIELDS:
+            setattr(self.pilot, name, getattr(self, name))
+        for name in PILOT_FIELDS:
+            setattr(self, name, getattr(pilot, name))
+        self.pilot = pilot
+
+    def make_ship(self):
+        offset = (2 * self.pilot.index - len(self.pilots) + 1) * SHIP_SPACING // 2
+        return PilotShip(self.pilot, 375 + offset)
+
+    def reset(self, score, current_time):
+        self.fly(self.pilots[0])
+        Simulation.reset(self, score, current_time)
+        for pilot in self.pilots[1:]:
+            self.fly(pilot)
+            for bullet in self.bullets.sprites():
+                bullet.kill()
+            self.player = self.make_ship()
+            self.allSprites.add(self.player)
+            self.playerGroup.add(self.player)
+            self.makeNewShip = False
+            self.shipAlive = True
+        self.fly(self.pilots[0])
+
+    def step(self, inputs):
+        if not self.startGame:
+            return
+        for pilot, (left, right, fire) in zip(self.pilots, inputs):
+            pilot.left = left
+            pilot.right = right
+            if fire:
+                self.fly(pilot)
+                self.fire()
+        Simulation.step(self)
+        self.fly(self.pilots[0])
+
+    def check_collisions(self, current_time):
+        for pilot in self.pilots:
+            self.fly(pilot)
+            Simulation.check_collisions(self, current_time)
+
+    def create_new_ship(self, current_time):
+        for pilot in self.pilots:
+            self.fly(pilot)
+            Simulation.create_new_ship(self, current_time)
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def integer(hello, field, default, allowed):
+    value = hello.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value not in allowed:
+        raise ProtocolError('{} must be an integer from {} to {}, not {!r}'.format(field, allowed[0], allowed[-1],
+                                                                                  value))
+    return value
+
+
+def parse_hello(kind, payload):
+    if kind != HELLO:
+        raise ProtocolError('expected a hello')
+    try:
+        hello = json.loads(payload)
+    except ValueError:
+        raise ProtocolError('the hello is not valid JSON')
+    if not isinstance(hello, dict):
+        raise ProtocolError('the hello must be a JSON object')
+    if hello.get('version') != PROTOCOL_VERSION:
+        raise ProtocolError('protocol version {} expected'.format(PROTOCOL_VERSION))
+    mode = hello.get('mode', 'coop')
+    if not isinstance(mode, str) or mode not in MODES:
+        raise ProtocolError('mode must be one of {}, not {!r}'.format(', '.join(MODES), mode))
+    size = integer(hello, 'players', 2, range(1, MAX_PLAYERS + 1))
+    difficulty = integer(hello, 'difficulty', 1, DIFFICULTIES)
+    waves = hello.get('waves', DEFAULT_WAVES)
+    if not isinstance(waves, str) or waves not in WAVES:
+        raise ProtocolError('unknown wave set {!r}'.format(waves))
+    name = hello.get('name')
+    if name is not None and not isinstance(name, str):
+        raise ProtocolError('name must be a string')
+    return mode, size, difficulty, waves, name
+
+
+def parse_input(payload):
+    if len(payload) != INPUT_MESSAGE.size:
+        raise ProtocolError('an input is {} bytes, not {}'.format(INPUT_MESSAGE.size, len(payload)))
+    return INPUT_MESSAGE.unpack(payload)
+
+
+def flags_for(sim):
+    return ((STARTED if sim.startGame else 0) | (GAME_OVER if sim.gameOver else 0) |
+            (BETWEEN_WAVES if sim.startGame and sim.between_waves() else 0))
+
+
+def encode_state(sim, opponents=()):
+    # Fixed size sections come first, so a bullet appearing only shifts the tail of the XOR delta.
+    enemies = sim.enemies
+    # The active pilot's ship lives in the simulation attributes until it is written back.
+    sim.fly(sim.pilot)
+    parts = [HEADER.pack(sim.tick, sim.score, sim.lives, sim.wave, flags_for(sim), len(sim.pilots), len(opponents))]
+    parts.extend(PILOT.pack(pilot.player.rect.x, pilot.player.rect.y, pilot.shipAlive) for pilot in sim.pilots)
+    parts.append(ENEMIES.pack(enemies.x, enemies.y, enemies.frame, enemies.rows, enemies.columns))
+    parts.append(np.packbits(enemies.alive).tobytes())
+    parts.append(MYSTERY.pack(sim.mysteryShip.rect.x, sim.mysteryShip.visible))
+    parts.append(COUNT.pack(len(sim.bunkers)))
+    parts.extend(np.packbits(np.frombuffer(bunker.cells, dtype=np.uint8)).tobytes() for bunker in sim.bunkers)
+    parts.extend(OPPONENT.pack(other.score, other.lives, other.wave, flags_for(other)) for other in opponents)
+    bullets = [(bullet.rect.x, bullet.rect.y, PLAYER_BULLET) for pilot in sim.pilots for bullet in pilot.bullets]
+    bullets.extend((bullet.rect.x, bullet.rect.y, ENEMY_BULLET) for bullet in sim.enemyBullets)
+    parts.append(COUNT.pack(len(bullets)))
+    parts.extend(BULLET.pack(*bullet) for bullet in bullets)
+    explosions = []
+    for explosion in sim.explosionsGroup:
+        if isinstance(explosion, EnemyExplosion):
+            stage = 0 if not explosion.visible else 1 if explosion.rect is explosion.rect1 else 2
+            explosions.append((ENEMY_EXPLOSION, explosion.rect1.x, explosion.rect1.y, stage, explosion.row))
+        elif isinstance(explosion, MysteryExplosion):
+            explosions.append((MYSTERY_EXPLOSION, explosion.position[0], explosion.position[1], explosion.visible,
+                               explosion.score))
+        else:
+            explosions.append((SHIP_EXPLOSION, explosion.rect.x, explosion.rect.y, explosion.visible, 0))
+    parts.append(COUNT.pack(len(explosions)))
+    parts.extend(EXPLOSION.pack(*explosion) for explosion in explosions)
+    return b''.join(parts)
+
+
+class WorldState(object):
+    def __init__(self, data, wave_set):
+        offset = 0
+        (self.tick, self.score, self.lives, self.wave, self.flags, pilots,
+         opponents) = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        self.pilots = [PILOT.unpack_from(data, offset + index * PILOT.size) for index in range(pilots)]
+        offset += pilots * PILOT.size
+        self.enemyX, self.enemyY, self.frame, rows, columns = ENEMIES.unpack_from(data, offset)
+        offset += ENEMIES.size
+        size = -(-rows * columns // 8)
+        self.alive = np.unpackbits(np.frombuffer(data, np.uint8, size, offset))[:rows * columns].reshape(rows, columns)
+        offset += size
+        self.mysteryX, self.mysteryVisible = MYSTERY.unpack_from(data, offset)
+        offset += MYSTERY.size
+        (bunkers,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        layout = wave_set.wave(self.wave).bunkers
+        self.bunkerLayout = layout
+        size = -(-layout.rows * layout.columns // 8)
+        self.bunkers = [data[offset + index * size:offset + (index + 1) * size] for index in range(bunkers)]
+        offset += bunkers * size
+        self.opponents = [OPPONENT.unpack_from(data, offset + index * OPPONENT.size) for index in range(opponents)]
+        offset += opponents * OPPONENT.size
+        (bullets,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        self.bullets = [BULLET.unpack_from(data, offset + index * BULLET.size) for index in range(bullets)]
+        offset += bullets * BULLET.size
+        (explosions,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        self.explosions = [EXPLOSION.unpack_from(data, offset + index * EXPLOSION.size) for index in range(explosions)]
+
+
+def xor_bytes(data, baseline):
+    # Unchanged bytes become zeros, which is what lets zlib squeeze a delta down to a handful of bytes.
+    baseline = baseline[:len(data)].ljust(len(data), b'\0')
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(baseline, 'little')).to_bytes(len(data), 'little')
+
+
+def encode_delta(state, baseline=b''):
+    # Raw deflate: the zlib header and checksum would be a fifth of a typical delta and TCP already checks the bytes.
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return compressor.compress(xor_bytes(state, baseline)) + compressor.flush()
+
+
+def decode_delta(payload, baseline, length):
+    return xor_bytes(zlib.decompress(payload, -15).ljust(length, b'\0'), baseline)
+
+
+def frame(kind, payload):
+    return FRAME.pack(kind, len(payload)) + payload
+
+
+async def read_frame(reader):
+    kind, length = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return kind, await reader.readexactly(length)
+
+
+class Player(object):
+    def __init__(self, writer, name=None):
+        self.writer = writer
+        self.name = name
+        self.inputs = deque()
+        self.bits = 0
+        self.sequence = 0
+        self.ack = 0
+        self.connected = True
+        self.sim = None
+        self.index = 0
+        self.session = None
+
+    def push(self, sequence, ack, bits):
+        self.ack = max(self.ack, ack)
+        if len(self.inputs) >= MAX_QUEUED_INPUTS:
+            self.inputs.popleft()
+        self.inputs.append((sequence, bits))
+
+    def next_input(self):
+        if self.inputs:
+            self.sequence, self.bits = self.inputs.popleft()
+        else:
+            # A late input repeats the last movement but never a shot.
+            self.bits &= ~FIRE
+        return unpack_input(self.bits)
+
+    def send(self, kind, payload):
+        if self.connected:
+            self.writer.write(frame(kind, payload))
+
+
+class Session(object):
+    def __init__(self, number, mode, size, difficulty, waves, seed):
+        self.number = number
+        self.mode = mode
+        self.size = size
+        self.difficulty = difficulty
+        self.waves = waves
+        self.seed = seed
+        self.players = []
+        self.sims = []
+        self.history = []
+        self.finished = False
+
+    def start(self):
+        if self.mode == 'coop':
+            self.sims = [CoopSimulation(self.size, self.difficulty, self.seed, self.waves)]
+        else:
+            self.sims = [CoopSimulation(1, self.difficulty, self.seed, self.waves) for _ in self.players]
+        for sim in self.sims:
+            sim.start()
+        self.history = [{} for _ in self.sims]
+        for index, player in enumerate(self.players):
+            player.sim = 0 if self.mode == 'coop' else index
+            player.index = index if self.mode == 'coop' else 0
+            player.send(WELCOME, json.dumps({'session': self.number, 'player': index, 'pilot': player.index,
+                                             'players': self.size, 'mode': self.mode, 'seed': self.seed,
+                                             'difficulty': self.difficulty, 'waves': self.waves,
+                                             'tick_rate': TICK_RATE}).encode())
+
+    def tick(self, stats):
+        for index, sim in enumerate(self.sims):
+            players = [player for player in self.players if player.sim == index]
+            sim.step([player.next_input() for player in players])
+            del sim.events[:]
+        states = []
+        for index, sim in enumerate(self.sims):
+            opponents = [other for other in self.sims if other is not sim]
+            state = encode_state(sim, opponents)
+            history = self.history[index]
+            history[sim.tick] = state
+            history.pop(sim.tick - HISTORY_TICKS, None)
+            states.append(state)
+        # Players that acknowledged the same snapshot share one encoded delta.
+        bodies = {}
+        for player in self.players:
+            if not player.connected:
+                continue
+            if player.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                stats['skipped'] += 1
+                continue
+            sim = self.sims[player.sim]
+            baseline = player.ack if player.ack in self.history[player.sim] else 0
+            key = (player.sim, baseline)
+            state = states[player.sim]
+            body = bodies.get(key)
+            if body is None:
+                body = bodies[key] = encode_delta(state, self.history[player.sim][baseline] if baseline else b'')
+            stats['delta_bytes' if baseline else 'full_bytes'] += STATE_HEADER.size + len(body)
+            stats['raw_bytes'] += len(state)
+            stats['deltas' if baseline else 'fulls'] += 1
+            player.send(STATE, STATE_HEADER.pack(sim.tick, baseline, player.sequence, len(state)) + body)
+        if all(sim.gameOver for sim in self.sims) or not any(player.connected for player in self.players):
+            self.finish()
+
+    def finish(self, message=None):
+        self.finished = True
+        if message is None:
+            message = {'scores': [sim.score for sim in self.sims], 'waves': [sim.wave for sim in self.sims]}
+        payload = json.dumps(message).encode()
+        for player in self.players:
+            player.send(BYE, payload)
+            if player.connected:
+                player.writer.close()
+                player.connected = False
+
+
+class Server(object):
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, seed=None):
+        self.host = host
+        self.port = port
+        self.random = Random(seed)
+        self.numbers = count(1)
+        self.lobby = {}
+        self.sessions = []
+        self.server = None
+        self.ticker = None
+        self.stats = {'ticks': 0, 'overruns': 0, 'skipped': 0, 'fulls': 0, 'deltas': 0, 'full_bytes': 0,
+                      'delta_bytes': 0, 'raw_bytes': 0, 'tick_times': deque(maxlen=TICK_RATE * 60)}
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ticker = asyncio.create_task(self.run())
+        return self
+
+    async def close(self):
+        self.ticker.cancel()
+        for session in self.sessions + list(self.lobby.values()):
+            session.finish()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        player = None
+        try:
+            mode, size, difficulty, waves, name = parse_hello(*await read_frame(reader))
+            player = Player(writer, name)
+            self.join(player, mode, size, difficulty, waves)
+            while True:
+                kind, payload = await read_frame(reader)
+                if kind == INPUT:
+                    player.push(*parse_input(payload))
+                elif kind == BYE:
+                    break
+        except ProtocolError as error:
+            # A malformed frame ends only this connection; the session carries on without the player.
+            writer.write(frame(BYE, json.dumps({'error': str(error)}).encode()))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if player is not None:
+                self.leave(player)
+            writer.close()
+
+    def leave(self, player):
+        player.connected = False
+        player.inputs.clear()
+        player.bits = 0
+        session = player.session
+        if session is None or session.sims:
+            # Pilots of a running game keep their place, the ship just stops taking input.
+            return
+        session.players.remove(player)
+        if not session.players:
+            key = (session.mode, session.size, session.difficulty, session.waves)
+            if self.lobby.get(key) is session:
+                del self.lobby[key]
+
+    def join(self, player, mode, size, difficulty, waves):
+        key = (mode, size, difficulty, waves)
+        session = self.lobby.get(key)
+        if session is None:
+            session = self.lobby[key] = Session(next(self.numbers), mode, size, difficulty, waves,
+                                                self.random.randrange(1 << 32))
+        session.players.append(player)
+        player.session = session
+        if len(session.players) == size:
+            del self.lobby[key]
+            try:
+                session.start()
+            except Exception as error:
+                # Everyone in the session is already out of the lobby, so they have to hear about it.
+                print('Could not start session {}: {!r}'.format(session.number, error), file=sys.stderr)
+                session.finish({'error': 'the game could not be started'})
+                return
+            self.sessions.append(session)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / TICK_RATE
+        deadline = loop.time()
+        stats = self.stats
+        while True:
+            start = perf_counter()
+            for session in self.sessions:
+                session.tick(stats)
+            self.sessions = [session for session in self.sessions if not session.finished]
+            stats['ticks'] += 1
+            stats['tick_times'].append(perf_counter() - start)
+            deadline += interval
+            delay = deadline - loop.time()
+            if delay < 0:
+                stats['overruns'] += 1
+                # Far behind means the process is overloaded; dropping ticks beats a burst of catch-up frames.
+                if delay < -0.25:
+                    deadline = loop.time()
+            await asyncio.sleep(max(0.0, delay))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a Space Invaders multiplayer server.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    async def serve():
+        server = await Server(args.host, args.port, args.seed).start()
+        print('Serving on {}:{}'.format(args.host, server.port))
+        await server.ticker
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,34 @@
+from pygame import sprite
+
+
+class Pool(object):
+    def __init__(self, factory):
+        self.factory = factory
+        self.free = []
+        self.created = 0
+
+    def acquire(self, *args):
+        if self.free:
+            item = self.free.pop()
+        else:
+            item = self.factory()
+            item.pool = self
+            self.created += 1
+        item.reset(*args)
+        item.active = True
+        return item
+
+    def release(self, item):
+        self.free.append(item)
+
+
+class PooledSprite(sprite.Sprite):
+    pool = None
+    active = False
+
+    def kill(self):
+        sprite.Sprite.kill(self)
+        if self.active:
+            self.active = False
+            if self.pool is not None:
+                self.pool.release(self)
@@ -0,0 +1,156 @@
+import atexit
+import os
+import sys
+from time import perf_counter, strftime
+
+import numpy as np
+from pygame import SRCALPHA, Surface, draw
+
+from config import BASE_PATH, FONT, GREEN, RED, WHITE, YELLOW
+from text import NumberText, render as render_text
+
+PROFILE_ENV = 'SPACE_INVADERS_PROFILE'
+PROFILE_FILE_ENV = 'SPACE_INVADERS_PROFILE_FILE'
+PROFILE_FILE = BASE_PATH + '/profile-%Y%m%d-%H%M%S.csv'
+PROFILE_CAPACITY = 3600
+PHASES = {'input_ms': ['check_input'],
+          'simulation_ms': ['enemies.update', 'allSprites.update', 'spawning', 'audio'],
+          'collisions_ms': ['check_collisions'],
+          'rendering_ms': ['drawing'],
+          'flip_ms': ['display.update'],
+          'overlay_ms': ['profiler'],
+          }
+COLUMNS = (['time_ms', 'frame_ms'] + list(PHASES) +
+           ['ticks', 'allocated_blocks', 'enemies', 'bullets', 'enemy_bullets', 'explosions', 'sprites'])
+
+OVERLAY_POSITION = (555, 30)
+GRAPH_FRAMES = 120
+GRAPH_HEIGHT = 60
+GRAPH_SCALE = 1.5
+FRAME_BUDGET_MS = 1000 / 60
+OVERLAY_ROWS = [('frame ms', 'frame_ms'), ('input us', 'input_ms'), ('sim us', 'simulation_ms'),
+                ('coll us', 'collisions_ms'), ('draw us', 'rendering_ms'), ('flip us', 'flip_ms'),
+                ('allocs', 'allocated_blocks'), ('enemies', 'enemies'), ('bullets', 'bullets'),
+                ('shots', 'enemy_bullets'), ('explode', 'explosions'), ('sprites', 'sprites')]
+
+
+class PhaseClock(object):
+    def __init__(self):
+        self.times = {}
+        self.last = perf_counter()
+
+    def start(self):
+        self.times = {}
+        self.last = perf_counter()
+
+    def lap(self, phase):
+        now = perf_counter()
+        self.times[phase] = self.times.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def total(self):
+        return sum(self.times.values())
+
+
+class FrameProfiler(object):
+    def __init__(self, capacity=PROFILE_CAPACITY, path=None, enabled=False):
+        self.clock = PhaseClock()
+        self.samples = np.zeros((capacity, len(COLUMNS)))
+        self.capacity = capacity
+        self.index = 0
+        self.count = 0
+        self.frames = 0
+        self.path = path or os.environ.get(PROFILE_FILE_ENV) or PROFILE_FILE
+        self.enabled = False
+        self.registered = False
+        self.blocks = sys.getallocatedblocks()
+        self.sim = None
+        self.tick = 0
+        self.overlay = None
+        # Filled with the overlay on its first draw, when the fonts are known to be initialised.
+        self.labels = []
+        self.numbers = []
+        if enabled:
+            self.toggle()
+
+    @classmethod
+    def from_environment(cls):
+        return cls(enabled=os.environ.get(PROFILE_ENV, '') not in ('', '0'))
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        if self.enabled:
+            self.blocks = sys.getallocatedblocks()
+            if not self.registered:
+                self.registered = True
+                atexit.register(self.dump_on_exit)
+
+    def end_frame(self, time_ms, frame_ms, sim=None):
+        times = self.clock.times
+        values = [time_ms, frame_ms]
+        values.extend(sum(times.get(phase, 0.0) for phase in phases) * 1000 for phases in PHASES.values())
+
+        blocks = sys.getallocatedblocks()
+        ticks = 0
+        counts = [0, 0, 0, 0, 0]
+        if sim is not None:
+            ticks = sim.tick - self.tick if sim is self.sim else sim.tick
+            self.sim, self.tick = sim, sim.tick
+            counts = [len(sim.enemies), len(sim.bullets), len(sim.enemyBullets), len(sim.explosionsGroup),
+                      len(sim.allSprites)]
+        values.append(ticks)
+        values.append(blocks - self.blocks)
+        values.extend(counts)
+        self.blocks = blocks
+
+        self.samples[self.index] = values
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.frames += 1
+
+    def rows(self):
+        if self.count < self.capacity:
+            return self.samples[:self.count]
+        return np.roll(self.samples, -self.index, axis=0)
+
+    def dump(self, path=None):
+        path = strftime(path or self.path)
+        np.savetxt(path, self.rows(), fmt='%.3f', delimiter=',', header=','.join(COLUMNS), comments='')
+        return path
+
+    def dump_on_exit(self):
+        if not self.count:
+            return
+        try:
+            print('Profile written to ' + self.dump())
+        except OSError as error:
+            print('Could not write the profile: {}'.format(error), file=sys.stderr)
+
+    def surface(self):
+        if self.overlay is None:
+            height = GRAPH_HEIGHT + 6 + (len(OVERLAY_ROWS) + 1) // 2 * 12
+            self.overlay = Surface((GRAPH_FRAMES * 2, height), SRCALPHA)
+            for index, (label, column) in enumerate(OVERLAY_ROWS):
+                xpos = 4 + index % 2 * 120
+                ypos = GRAPH_HEIGHT + 6 + index // 2 * 12
+                self.labels.append((render_text(FONT, 10, label, WHITE), (xpos, ypos)))
+                self.numbers.append((NumberText(FONT, 10, GREEN, xpos + 72, ypos), COLUMNS.index(column)))
+
+        overlay = self.overlay
+        overlay.fill((0, 0, 0, 170))
+        rows = self.rows()[-GRAPH_FRAMES:]
+        for xpos, frameMs in enumerate(rows[:, 1].tolist()):
+            color = GREEN if frameMs <= FRAME_BUDGET_MS + 1 else YELLOW if frameMs <= FRAME_BUDGET_MS * 2 else RED
+            top = GRAPH_HEIGHT - min(GRAPH_HEIGHT, int(frameMs * GRAPH_SCALE))
+            draw.line(overlay, color, (xpos * 2, GRAPH_HEIGHT), (xpos * 2, top))
+        budget = GRAPH_HEIGHT - int(FRAME_BUDGET_MS * GRAPH_SCALE)
+        draw.line(overlay, WHITE, (0, budget), (GRAPH_FRAMES * 2, budget))
+
+        overlay.blits(self.labels, doreturn=False)
+        latest = rows[-1].tolist() if len(rows) else [0.0] * len(COLUMNS)
+        for number, column in self.numbers:
+            value = latest[column]
+            if COLUMNS[column].endswith('_ms') and column != 1:
+                value *= 1000
+            number.draw(overlay, max(0, int(value)))
+        return overlay
@@ -0,0 +1,195 @@
+from pygame import BLEND_RGBA_MAX, SRCALPHA, Rect, Surface, display
+
+FULL_REDRAW_RATIO = 0.5
+ATLAS_WIDTH = 512
+ATLAS_PADDING = 1
+
+
+class DirtyRenderer(object):
+    def __init__(self, screen, dirty=True):
+        self.screen = screen
+        self.screenRect = screen.get_rect()
+        self.dirty = dirty
+        self.background = None
+        self.items = []
+        self.previous = {}
+        self.changed = []
+        self.fullRedraw = True
+
+    def begin(self, background, changed=()):
+        if background is not self.background or changed is None:
+            self.background = background
+            self.fullRedraw = True
+        else:
+            self.changed.extend(changed)
+        self.items = []
+
+    def blit(self, source, dest, area=None, version=0):
+        if area is None:
+            rect = source.get_rect(topleft=(dest[0], dest[1]))
+        else:
+            rect = Rect(dest[0], dest[1], area[2], area[3])
+        self.items.append((source, rect, area, version))
+
+    def blits(self, blit_sequence, doreturn=False):
+        append = self.items.append
+        for item in blit_sequence:
+            source, dest = item[0], item[1]
+            area = item[2] if len(item) > 2 else None
+            if area is None:
+                rect = source.get_rect(topleft=(dest[0], dest[1]))
+            else:
+                rect = Rect(dest[0], dest[1], area[2], area[3])
+            append((source, rect, area, 0))
+
+    def invalidate(self):
+        self.fullRedraw = True
+
+    def render(self):
+        current = {}
+        for source, rect, area, version in self.items:
+            key = (source, rect.x, rect.y, None if area is None else tuple(area), version)
+            current[key] = rect
+        previous, self.previous = self.previous, current
+        changed, self.changed = self.changed, []
+
+        if not self.dirty or self.fullRedraw:
+            return self.redraw()
+
+        dirtyRects = [rect for key, rect in previous.items() if key not in current]
+        dirtyRects.extend(rect for key, rect in current.items() if key not in previous)
+        dirtyRects.extend(changed)
+        dirtyRects = [rect.clip(self.screenRect) for rect in dirtyRects]
+        dirtyRects = [rect for rect in dirtyRects if rect]
+        if not dirtyRects:
+            return []
+        area = sum(rect.w * rect.h for rect in dirtyRects)
+        if area > FULL_REDRAW_RATIO * self.screenRect.w * self.screenRect.h:
+            return self.redraw()
+
+        screen = self.screen
+        itemRects = [item[1] for item in self.items]
+        for dirtyRect in dirtyRects:
+            screen.set_clip(dirtyRect)
+            screen.blit(self.background, dirtyRect, dirtyRect)
+            # Measured: a blits call per dirty rectangle is slower here than the plain loop under a clip.
+            for index in dirtyRect.collidelistall(itemRects):
+                source, rect, area, _ = self.items[index]
+                screen.blit(source, rect, area)
+        screen.set_clip(None)
+        return dirtyRects
+
+    def redraw(self):
+        self.fullRedraw = False
+        self.screen.blit(self.background, (0, 0))
+        self.screen.blits([item[:3] for item in self.items], doreturn=False)
+        return None
+
+    def present(self):
+        self.flip(self.render())
+
+    @staticmethod
+    def flip(dirtyRects):
+        if dirtyRects is None:
+            display.update()
+        elif dirtyRects:
+            display.update(dirtyRects)
+
+
+class StaticLayer(object):
+    def __init__(self, surface):
+        self.surface = surface
+        self.renderer = DirtyRenderer(surface)
+
+    def compose(self, background, items):
+        # The layer is kept up to date with the same dirty rectangle pass as the screen, so a bunker hit only
+        # recomposes that bunker. The returned rectangles are what changed on the layer, None meaning all of it.
+        self.renderer.begin(background)
+        for source, dest, version in items:
+            self.renderer.blit(source, dest, version=version)
+        return self.renderer.render()
+
+
+class FormationCache(object):
+    def __init__(self, images):
+        self.images = images
+        self.formation = None
+        self.version = None
+        self.surfaces = {}
+
+    def surface(self, formation):
+        if formation is not self.formation or formation.version != self.version:
+            self.formation = formation
+            self.version = formation.version
+            self.surfaces = {}
+        surface = self.surfaces.get(formation.frame)
+        if surface is None:
+            surface = self.surfaces[formation.frame] = self.compose(formation, formation.frame)
+        return surface
+
+    def compose(self, formation, frame):
+        surface = Surface((formation.columns * formation.columnWidth, formation.rows * formation.rowHeight), SRCALPHA)
+        rows, columns, _, _ = formation.positions()
+        size = (formation.width, formation.height)
+        rowImages = [self.images(names[frame], size) for names in formation.rowImages]
+        # Enemies never overlap, so a max blend onto the transparent surface copies pixels exactly.
+        surface.blits([(rowImages[row], (column * formation.columnWidth, row * formation.rowHeight),
+                        None, BLEND_RGBA_MAX)
+                       for row, column in zip(rows.tolist(), columns.tolist())], doreturn=False)
+        return surface
+
+
+class SpriteAtlas(object):
+    # Sprite images are copied onto shelves of one surface the first time they are drawn, so a whole layer of
+    # sprites becomes (atlas, dest, area) tuples for a single blits call. Images must not change once packed.
+    def __init__(self, width=ATLAS_WIDTH):
+        self.width = width
+        self.surface = self.convert(Surface((width, 64), SRCALPHA))
+        self.areas = {}
+        self.x = 0
+        self.y = 0
+        self.shelf = 0
+
+    def add(self, images):
+        # Packing the tallest images first keeps the shelves tight.
+        for image in sorted(images, key=lambda image: -image.get_height()):
+            self.area(image)
+
+    def area(self, image):
+        area = self.areas.get(image)
+        if area is None:
+            area = self.areas[image] = self.pack(image)
+        return area
+
+    def pack(self, image):
+        width, height = image.get_size()
+        if self.x + width > self.width:
+            self.x = 0
+            self.y += self.shelf + ATLAS_PADDING
+            self.shelf = 0
+        if width > self.width or self.y + height > self.surface.get_height():
+            self.grow(max(width, self.width), self.y + height)
+        # A plain tuple, since the renderer keys every item on its area.
+        area = (self.x, self.y, width, height)
+        # The atlas starts fully transparent, so a max blend copies colour and alpha exactly.
+        self.surface.blit(image, area[:2], special_flags=BLEND_RGBA_MAX)
+        self.x += width + ATLAS_PADDING
+        self.shelf = max(self.shelf, height)
+        return area
+
+    def grow(self, width, height):
+        surface = Surface((width, max(height, 2 * self.surface.get_height())), SRCALPHA)
+        surface.blit(self.surface, (0, 0), special_flags=BLEND_RGBA_MAX)
+        self.surface = self.convert(surface)
+        self.width = width
+
+    @staticmethod
+    def convert(surface):
+        # Blits from an atlas in another pixel format than the screen's are converted pixel by pixel every time.
+        return surface.convert_alpha() if display.get_surface() else surface
+
+    def blits(self, sprites):
+        # Areas first: packing a new image may replace the surface the earlier tuples would point at.
+        areas = [(dest, self.area(image)) for image, dest in sprites]
+        surface = self.surface
+        return [(surface, dest, area) for dest, area in areas]
@@ -0,0 +1,250 @@
+import os
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import atexit
+import json
+import struct
+import zlib
+from bisect import bisect_right
+from time import strftime
+
+from simulation import TICK_RATE, Simulation
+from waves import DEFAULT_WAVES
+
+MAGIC = b'SIRP'
+FORMAT_VERSION = 1
+KEYFRAME_TICKS = TICK_RATE * 60
+LEFT, RIGHT, FIRE, PAUSE = 1, 2, 4, 8
+CHUNK = struct.Struct('<cI')
+TICK = struct.Struct('<I')
+
+
+def pack_input(left, right, fire, paused=False):
+    return (LEFT if left else 0) | (RIGHT if right else 0) | (FIRE if fire else 0) | (PAUSE if paused else 0)
+
+
+def unpack_input(value):
+    return bool(value & LEFT), bool(value & RIGHT), bool(value & FIRE)
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_inputs(inputs):
+    # Players hold keys for many ticks, so (input, run length) pairs shrink a minute to a few hundred bytes.
+    out = bytearray()
+    index = 0
+    while index < len(inputs):
+        value = inputs[index]
+        end = index + 1
+        while end < len(inputs) and inputs[end] == value:
+            end += 1
+        out.append(value)
+        write_varint(out, end - index)
+        index = end
+    return zlib.compress(bytes(out), 9)
+
+
+def decode_inputs(data):
+    data = zlib.decompress(data)
+    inputs = bytearray()
+    offset = 0
+    while offset < len(data):
+        value = data[offset]
+        count, offset = read_varint(data, offset + 1)
+        inputs.extend(bytes((value,)) * count)
+    return inputs
+
+
+def encode_keyframe(state):
+    state = dict(state)
+    version, internal, gauss = state.pop('random')
+    # The Mersenne Twister state is 625 random words that zlib cannot shrink, so it is stored packed.
+    return (struct.pack('<I{}I'.format(len(internal)), len(internal), *internal) +
+            zlib.compress(json.dumps([version, gauss, state], separators=(',', ':')).encode(), 9))
+
+
+def decode_keyframe(data):
+    (count,) = struct.unpack_from('<I', data)
+    internal = struct.unpack_from('<{}I'.format(count), data, 4)
+    version, gauss, state = json.loads(zlib.decompress(data[4 + 4 * count:]))
+    state['random'] = (version, internal, gauss)
+    return state
+
+
+class ReplayRecorder(object):
+    def __init__(self, path, keyframe_ticks=KEYFRAME_TICKS):
+        self.path = path
+        self.keyframeTicks = keyframe_ticks
+        self.file = None
+        self.inputs = bytearray()
+        self.start = 0
+        self.paused = False
+        atexit.register(self.close)
+
+    def begin(self, sim, settings=None):
+        self.close()
+        self.file = open(strftime(self.path), 'wb')
+        self.file.write(MAGIC + bytes((FORMAT_VERSION,)))
+        header = {'seed': sim.seed, 'difficulty': sim.difficulty, 'waves': sim.waves.name, 'tick_rate': TICK_RATE,
+                  'tick': sim.tick, 'keyframe_ticks': self.keyframeTicks, 'settings': settings or {}}
+        self.write_chunk(b'H', zlib.compress(json.dumps(header).encode()))
+        if sim.tick:
+            self.write_chunk(b'K', TICK.pack(sim.tick) + encode_keyframe(sim.snapshot()))
+        self.inputs = bytearray()
+        self.start = sim.tick
+        self.paused = False
+
+    def write_chunk(self, kind, payload):
+        self.file.write(CHUNK.pack(kind, len(payload)))
+        self.file.write(payload)
+
+    def mark_pause(self):
+        self.paused = True
+
+    def record(self, sim, left, right, fire):
+        if self.file is None:
+            return
+        self.inputs.append(pack_input(left, right, fire, self.paused))
+        self.paused = False
+        if sim.tick % self.keyframeTicks == 0 and not sim.gameOver:
+            self.flush_inputs()
+            self.write_chunk(b'K', TICK.pack(sim.tick) + encode_keyframe(sim.snapshot()))
+            self.file.flush()
+
+    def flush_inputs(self):
+        if self.inputs:
+            self.write_chunk(b'I', TICK.pack(self.start) + encode_inputs(self.inputs))
+            self.start += len(self.inputs)
+            self.inputs = bytearray()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush_inputs()
+        self.file.close()
+        self.file = None
+
+
+class Replay(object):
+    def __init__(self, header, inputs, keyframes):
+        self.header = header
+        self.inputs = inputs
+        self.keyframes = keyframes
+        self.keyframeTicks = sorted(keyframes)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != MAGIC or data[4] != FORMAT_VERSION:
+            raise ValueError('{} is not a replay this version can read'.format(path))
+        header = None
+        inputs = bytearray()
+        keyframes = {}
+        offset = 5
+        while offset + CHUNK.size <= len(data):
+            kind, length = CHUNK.unpack_from(data, offset)
+            offset += CHUNK.size
+            payload = data[offset:offset + length]
+            offset += length
+            if len(payload) < length:
+                break
+            if kind == b'H':
+                header = json.loads(zlib.decompress(payload))
+            elif kind == b'I':
+                (start,) = TICK.unpack_from(payload)
+                inputs[start - header['tick']:] = decode_inputs(payload[TICK.size:])
+            elif kind == b'K':
+                (tick,) = TICK.unpack_from(payload)
+                # Keyframes stay encoded until a seek needs them.
+                keyframes[tick] = payload[TICK.size:]
+        if header is None:
+            raise ValueError('{} has no replay header'.format(path))
+        return cls(header, inputs, keyframes)
+
+    @property
+    def first_tick(self):
+        return self.header['tick']
+
+    @property
+    def last_tick(self):
+        return self.header['tick'] + len(self.inputs)
+
+    def input(self, tick):
+        return unpack_input(self.inputs[tick - self.header['tick']])
+
+    def pauses(self):
+        return [self.header['tick'] + index + 1 for index, value in enumerate(self.inputs) if value & PAUSE]
+
+    def keyframe(self, tick):
+        return decode_keyframe(self.keyframes[tick])
+
+    def seek(self, tick):
+        tick = max(self.first_tick, min(tick, self.last_tick))
+        index = bisect_right(self.keyframeTicks, tick)
+        if index:
+            sim = Simulation.from_snapshot(self.keyframe(self.keyframeTicks[index - 1]))
+        else:
+            sim = Simulation(self.header['difficulty'], self.header['seed'], self.header.get('waves', DEFAULT_WAVES))
+            sim.start()
+        while sim.tick < tick and not sim.gameOver:
+            sim.step(*self.input(sim.tick))
+            del sim.events[:]
+        return sim
+
+
+def verify(replay):
+    sim = replay.seek(replay.first_tick)
+    mismatches = []
+    for tick in replay.keyframeTicks:
+        while sim.tick < tick and not sim.gameOver:
+            sim.step(*replay.input(sim.tick))
+            del sim.events[:]
+        if sim.snapshot() != replay.keyframe(tick):
+            mismatches.append(tick)
+    return mismatches
+
+
+if __name__ == '__main__':
+    import argparse
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description='Inspect, verify and seek Space Invaders replays.')
+    parser.add_argument('path')
+    parser.add_argument('--seek', type=float, default=None, help='restore the game at this many seconds')
+    parser.add_argument('--verify', action='store_true', help='replay from the start and check every keyframe')
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+    seconds = len(replay.inputs) / TICK_RATE
+    size = os.path.getsize(args.path)
+    print('seed {seed} difficulty {difficulty}, ticks {first}-{last} ({seconds:.0f} s), {keyframes} keyframes, '
+          '{size} bytes ({rate:.0f} bytes/min), {pauses} pauses'.format(
+              seed=replay.header['seed'], difficulty=replay.header['difficulty'], first=replay.first_tick,
+              last=replay.last_tick, seconds=seconds, keyframes=len(replay.keyframes), size=size,
+              rate=size * 60 / seconds if seconds else 0, pauses=len(replay.pauses())))
+    if args.seek is not None:
+        start = perf_counter()
+        sim = replay.seek(int(args.seek * TICK_RATE))
+        print('tick {} score {} lives {} wave {} enemies {} (seek took {:.1f} ms)'.format(
+            sim.tick, sim.score, sim.lives, sim.wave, len(sim.enemies), (perf_counter() - start) * 1000))
+    if args.verify:
+        mismatches = verify(replay)
+        print('all keyframes match' if not mismatches else 'diverged at ticks {}'.format(mismatches))
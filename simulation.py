@@ -0,0 +1,701 @@
+from random import Random, randrange
+
+import numpy as np
+from pygame import Rect, Surface, sprite
+
+from assets import IMAGES
+from pools import Pool, PooledSprite
+
+from collisions import BULLET_CELL_SIZE, BUNKER_CELL_SIZE, SpatialHash, grid_range
+from config import GREEN
+from waves import DEFAULT_WAVES, EXPLOSION_GROWTH, WAVES
+
+TICK_RATE = 60
+TICK_MS = 1000 / TICK_RATE
+MYSTERY_SCORES = [50, 100, 150, 300]
+
+BUNKER_HOLE = (0, 0, 0)
+SNAPSHOT_FIELDS = ['difficulty', 'seed', 'tick', 'enemyPosition', 'wave', 'score', 'lives', 'startGame', 'gameOver',
+                   'shipAlive', 'makeNewShip', 'gameTimer', 'timer', 'noteTimer', 'shipTimer', 'noteIndex']
+ENEMY_SNAPSHOT_FIELDS = ['x', 'y', 'frame', 'version', 'leftAddMove', 'rightAddMove', 'moveTime', 'direction',
+                         'rightMoves', 'leftMoves', 'moveNumber', 'timer', 'bottom', 'count']
+
+
+class Ship(sprite.Sprite):
+    def __init__(self):
+        sprite.Sprite.__init__(self)
+        self.image = IMAGES['ship']
+        self.rect = self.image.get_rect(topleft=(375, 540))
+        self.speed = 5
+        self.visible = True
+
+    def update(self, current_time, left=False, right=False, *args):
+        if left and self.rect.x > 10:
+            self.rect.x -= self.speed
+        if right and self.rect.x < 740:
+            self.rect.x += self.speed
+
+
+class Bullet(PooledSprite):
+    def __init__(self):
+        PooledSprite.__init__(self)
+        self.rect = Rect(0, 0, 0, 0)
+        self.visible = True
+
+    def reset(self, xpos, ypos, direction, speed, filename, side):
+        self.image = IMAGES[filename]
+        self.rect.size = self.image.get_size()
+        self.rect.topleft = (xpos, ypos)
+        self.speed = speed
+        self.direction = direction
+        self.side = side
+        self.filename = filename
+
+    def update(self, *args):
+        self.rect.y += self.speed * self.direction
+        if self.rect.y < 15 or self.rect.y > 600:
+            self.kill()
+
+
+class EnemiesGroup(object):
+    def __init__(self, wave, enemy_position, current_time, rng):
+        self.wave = wave
+        self.columns = wave.columns
+        self.rows = wave.rows
+        self.alive = wave.shape.copy()
+        self.rowIndex, self.columnIndex = np.indices((self.rows, self.columns))
+        self.count = int(self.alive.sum())
+        self.x = wave.left
+        self.y = enemy_position
+        self.columnWidth = wave.columnWidth
+        self.rowHeight = wave.rowHeight
+        self.width = wave.width
+        self.height = wave.height
+        self.rowImages = [enemy.images for enemy in wave.rowTypes]
+        self.frame = 0
+        self.version = 0
+        self.random = rng
+        self.leftAddMove = 0
+        self.rightAddMove = 0
+        self.moveTime = wave.moveTime
+        self.direction = 1
+        self.rightMoves = wave.moves
+        self.leftMoves = wave.moves
+        self.moveNumber = wave.moves // 2
+        self.timer = current_time
+        self.update_edges()
+        self.update_bottom()
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def update(self, current_time):
+        if current_time - self.timer > self.moveTime:
+            if self.direction == 1:
+                max_move = self.rightMoves + self.rightAddMove
+            else:
+                max_move = self.leftMoves + self.leftAddMove
+
+            if self.moveNumber >= max_move:
+                self.leftMoves = self.wave.moves + self.rightAddMove
+                self.rightMoves = self.wave.moves + self.leftAddMove
+                self.direction *= -1
+                self.moveNumber = 0
+                self.y += self.wave.drop
+                self.update_bottom()
+            else:
+                self.x += self.wave.step * self.direction
+                self.moveNumber += 1
+            self.frame ^= 1
+            self.timer += self.moveTime
+
+    def update_bottom(self):
+        rows = np.flatnonzero(self.alive.any(axis=1))
+        self.bottom = self.y + rows[-1] * self.rowHeight + self.height if len(rows) else 0
+
+    def update_edges(self):
+        # Every empty column on an edge lets the formation sweep one column width further that way.
+        columns = self.alive_columns()
+        if len(columns):
+            movesPerColumn = self.columnWidth // self.wave.step
+            self.leftAddMove = movesPerColumn * int(columns[0])
+            self.rightAddMove = movesPerColumn * (self.columns - 1 - int(columns[-1]))
+
+    def rect(self, row, column):
+        return Rect(self.x + column * self.columnWidth, self.y + row * self.rowHeight, self.width, self.height)
+
+    def positions(self):
+        rows = self.rowIndex[self.alive]
+        columns = self.columnIndex[self.alive]
+        return rows, columns, self.x + columns * self.columnWidth, self.y + rows * self.rowHeight
+
+    def collide(self, rect):
+        hits = []
+        for row in grid_range(rect.top, rect.bottom, self.y, self.rowHeight, self.rows):
+            top = self.y + row * self.rowHeight
+            if top >= rect.bottom or top + self.height <= rect.top:
+                continue
+            alive = self.alive[row]
+            for column in grid_range(rect.left, rect.right, self.x, self.columnWidth, self.columns):
+                left = self.x + column * self.columnWidth
+                if alive[column] and left < rect.right and left + self.width > rect.left:
+                    hits.append((row, column))
+        return hits
+
+    def alive_columns(self):
+        return np.flatnonzero(self.alive.any(axis=0))
+
+    def random_bottom(self):
+        column = self.random.choice(self.alive_columns().tolist())
+        row = np.flatnonzero(self.alive[:, column])[-1]
+        return int(row), column
+
+    def update_speed(self):
+        moveTime = self.wave.speed(self.count) if self.count else None
+        if moveTime is not None:
+            self.moveTime = moveTime
+
+    def kill(self, row, column):
+        if not self.alive[row, column]:
+            return
+        self.alive[row, column] = False
+        self.count -= 1
+        self.version += 1
+        self.update_edges()
+        self.update_speed()
+
+
+class Bunker(sprite.Sprite):
+    def __init__(self, xpos, ypos, rows=4, columns=9, cell_size=10, color=GREEN):
+        sprite.Sprite.__init__(self)
+        self.rows = rows
+        self.columns = columns
+        self.cellSize = cell_size
+        self.cells = bytearray(b'\x01' * (rows * columns))
+        self.aliveCells = rows * columns
+        self.image = Surface((columns * cell_size, rows * cell_size))
+        self.image.fill(color)
+        self.image.set_colorkey(BUNKER_HOLE)
+        self.rect = self.image.get_rect(topleft=(xpos, ypos))
+        self.version = 0
+        self.visible = True
+
+    def hit(self, rect):
+        left = max(rect.left, self.rect.left) - self.rect.left
+        right = min(rect.right, self.rect.right) - self.rect.left
+        top = max(rect.top, self.rect.top) - self.rect.top
+        bottom = min(rect.bottom, self.rect.bottom) - self.rect.top
+        if left >= right or top >= bottom or not self.aliveCells:
+            return False
+        size = self.cellSize
+        destroyed = False
+        for row in range(top // size, (bottom - 1) // size + 1):
+            offset = row * self.columns
+            for column in range(left // size, (right - 1) // size + 1):
+                if self.cells[offset + column]:
+                    self.cells[offset + column] = 0
+                    self.image.fill(BUNKER_HOLE, (column * size, row * size, size, size))
+                    destroyed = True
+                    self.aliveCells -= 1
+        if destroyed:
+            self.version += 1
+        return destroyed
+
+
+class Mystery(sprite.Sprite):
+    def __init__(self, current_time, events):
+        sprite.Sprite.__init__(self)
+        self.image = IMAGES.scaled('mystery', (75, 35))
+        self.rect = self.image.get_rect(topleft=(-80, 45))
+        self.moveTime = 25000
+        self.direction = 1
+        self.timer = current_time
+        self.events = events
+        self.playSound = True
+        self.visible = False
+
+    def update(self, currentTime, *args):
+        resetTimer = False
+        self.visible = False
+        passed = currentTime - self.timer
+        if passed > self.moveTime:
+            if (self.rect.x < 0 or self.rect.x > 800) and self.playSound:
+                self.events.append(('play', 'mysteryentered'))
+                self.events.append(('fadeout', 'mysteryentered'))
+                self.playSound = False
+            if self.rect.x < 840 and self.direction == 1:
+                self.rect.x += 2
+                self.visible = True
+            if self.rect.x > -100 and self.direction == -1:
+                self.rect.x -= 2
+                self.visible = True
+        if self.rect.x > 830:
+            self.playSound = True
+            self.direction = -1
+            resetTimer = True
+        if self.rect.x < -90:
+            self.playSound = True
+            self.direction = 1
+            resetTimer = True
+        if passed > self.moveTime and resetTimer:
+            self.timer = currentTime
+
+
+class EnemyExplosion(PooledSprite):
+    def __init__(self):
+        PooledSprite.__init__(self)
+        self.rect1 = Rect(0, 0, 0, 0)
+        self.rect2 = Rect(0, 0, 0, 0)
+
+    def reset(self, rect, row, name, current_time):
+        self.rect1.size = rect.size
+        self.rect2.size = (rect.width + EXPLOSION_GROWTH, rect.height + EXPLOSION_GROWTH)
+        self.image1 = IMAGES.scaled(name, self.rect1.size)
+        self.image2 = IMAGES.scaled(name, self.rect2.size)
+        self.rect1.topleft = (rect.x, rect.y)
+        self.rect2.topleft = (rect.x - 6, rect.y - 6)
+        self.row = row
+        self.image = self.image1
+        self.rect = self.rect1
+        self.timer = current_time
+        self.visible = True
+
+    def update(self, current_time, *args):
+        passed = current_time - self.timer
+        if passed <= 100:
+            self.image = self.image1
+            self.rect = self.rect1
+            self.visible = True
+        elif passed <= 200:
+            self.image = self.image2
+            self.rect = self.rect2
+            self.visible = True
+        elif 400 < passed:
+            self.kill()
+        else:
+            self.visible = False
+
+
+class MysteryExplosion(PooledSprite):
+    def reset(self, mystery, score, current_time):
+        self.score = score
+        self.position = (mystery.rect.x + 20, mystery.rect.y + 6)
+        self.timer = current_time
+        self.visible = True
+
+    def update(self, current_time, *args):
+        passed = current_time - self.timer
+        self.visible = passed <= 200 or 400 < passed <= 600
+        if 600 < passed:
+            self.kill()
+
+
+class ShipExplosion(PooledSprite):
+    def __init__(self):
+        PooledSprite.__init__(self)
+        self.image = IMAGES['ship']
+        self.rect = self.image.get_rect()
+
+    def reset(self, ship, current_time):
+        self.rect.topleft = (ship.rect.x, ship.rect.y)
+        self.timer = current_time
+        self.visible = False
+
+    def update(self, current_time, *args):
+        passed = current_time - self.timer
+        self.visible = 300 < passed <= 600
+        if 900 < passed:
+            self.kill()
+
+
+class Simulation(object):
+    def __init__(self, difficulty=1, seed=None, waves=DEFAULT_WAVES):
+        self.difficulty = difficulty
+        self.waves = WAVES[waves]
+        self.seed = randrange(1 << 32) if seed is None else seed
+        self.random = Random(self.seed)
+        self.tick = 0
+        self.phaseClock = None
+        self.bulletPool = Pool(Bullet)
+        self.enemyExplosionPool = Pool(EnemyExplosion)
+        self.mysteryExplosionPool = Pool(MysteryExplosion)
+        self.shipExplosionPool = Pool(ShipExplosion)
+        self.bullets = sprite.Group()
+        self.enemyBullets = sprite.Group()
+        self.explosionsGroup = sprite.Group()
+        self.enemyPosition = self.waves.position(1)
+        self.wave = 1
+        self.score = 0
+        self.lives = 3
+        self.startGame = False
+        self.gameOver = False
+        self.shipAlive = False
+        self.makeNewShip = False
+        self.events = []
+
+    @property
+    def time(self):
+        return self.tick * 1000 // TICK_RATE
+
+    def start(self):
+        current_time = self.time
+        self.enemyPosition = self.waves.position(1)
+        self.wave = 1
+        self.make_bunkers()
+        self.lives = 3
+        self.gameOver = False
+        self.gameTimer = current_time
+        self.reset(0, current_time)
+        self.startGame = True
+
+    def reset(self, score, current_time):
+        for group in (self.bullets, self.enemyBullets, self.explosionsGroup):
+            for pooled in group.sprites():
+                pooled.kill()
+        self.player = self.make_ship()
+        self.playerGroup = sprite.Group(self.player)
+        self.mysteryShip = Mystery(current_time, self.events)
+        self.mysteryGroup = sprite.Group(self.mysteryShip)
+        self.bulletHash = SpatialHash(BULLET_CELL_SIZE)
+        self.make_enemies(current_time)
+        self.allSprites = sprite.Group(self.player, self.mysteryShip)
+        self.timer = current_time
+        self.noteTimer = current_time
+        self.shipTimer = current_time
+        self.score = score
+        self.noteIndex = 0
+        self.makeNewShip = False
+        self.shipAlive = True
+
+    def snapshot(self):
+        state = {name: getattr(self, name) for name in SNAPSHOT_FIELDS}
+        state['waves'] = self.waves.name
+        state['random'] = self.random.getstate()
+        enemies = self.enemies
+        state['enemies'] = {name: int(getattr(enemies, name)) for name in ENEMY_SNAPSHOT_FIELDS}
+        state['enemies']['alive'] = enemies.alive.ravel().astype(int).tolist()
+        state['bunkers'] = [[bytes(bunker.cells).hex(), bunker.aliveCells, bunker.version] for bunker in self.bunkers]
+        player = self.player
+        state['player'] = [player.rect.x, player.rect.y, player.alive()]
+        mystery = self.mysteryShip
+        state['mystery'] = [mystery.rect.x, mystery.rect.y, mystery.direction, mystery.timer, mystery.playSound,
+                            mystery.visible]
+        # Group order decides update and collision order, so sprites are listed the way the groups hold them.
+        sprites = []
+        for entity in self.allSprites:
+            if entity is player:
+                sprites.append('player')
+            elif entity is mystery:
+                sprites.append('mystery')
+            else:
+                sprites.append([entity.rect.x, entity.rect.y, entity.direction, entity.speed, entity.filename,
+                                entity.side, self.bullets.has(entity)])
+        state['sprites'] = sprites
+        explosions = []
+        for explosion in self.explosionsGroup:
+            if isinstance(explosion, EnemyExplosion):
+                explosions.append(['enemy', explosion.rect1.x, explosion.rect1.y, explosion.row, explosion.timer,
+                                   explosion.visible, explosion.rect is explosion.rect2])
+            elif isinstance(explosion, MysteryExplosion):
+                explosions.append(['mystery', explosion.position[0], explosion.position[1], explosion.score,
+                                   explosion.timer, explosion.visible])
+            else:
+                explosions.append(['ship', explosion.rect.x, explosion.rect.y, explosion.timer, explosion.visible])
+        state['explosions'] = explosions
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        sim = cls(state['difficulty'], state['seed'], state.get('waves', DEFAULT_WAVES))
+        sim.start()
+        for name in SNAPSHOT_FIELDS:
+            setattr(sim, name, state[name])
+        version, internal, gauss = state['random']
+        sim.random.setstate((version, tuple(internal), gauss))
+        # start() built the first wave, the formation and bunker layout have to match the restored one.
+        sim.make_bunkers()
+        sim.make_enemies(sim.time)
+
+        enemies = sim.enemies
+        for name in ENEMY_SNAPSHOT_FIELDS:
+            setattr(enemies, name, state['enemies'][name])
+        enemies.alive[...] = np.array(state['enemies']['alive'], dtype=bool).reshape(enemies.alive.shape)
+
+        for bunker, (cells, aliveCells, version) in zip(sim.bunkers, state['bunkers']):
+            bunker.cells = bytearray(bytes.fromhex(cells))
+            size = bunker.cellSize
+            for index, cell in enumerate(bunker.cells):
+                if not cell:
+                    row, column = divmod(index, bunker.columns)
+                    bunker.image.fill(BUNKER_HOLE, (column * size, row * size, size, size))
+            bunker.aliveCells = aliveCells
+            bunker.version = version
+
+        player = sim.player
+        player.rect.topleft = state['player'][:2]
+        if not state['player'][2]:
+            player.kill()
+        mystery = sim.mysteryShip
+        (mystery.rect.x, mystery.rect.y, mystery.direction, mystery.timer, mystery.playSound,
+         mystery.visible) = state['mystery']
+
+        sim.allSprites.empty()
+        for entry in state['sprites']:
+            if entry == 'player':
+                sim.allSprites.add(player)
+            elif entry == 'mystery':
+                sim.allSprites.add(mystery)
+            else:
+                xpos, ypos, direction, speed, filename, side, fromPlayer = entry
+                bullet = sim.bulletPool.acquire(xpos, ypos, direction, speed, filename, side)
+                bullet.add(sim.bullets if fromPlayer else sim.enemyBullets, sim.allSprites)
+
+        for entry in state['explosions']:
+            if entry[0] == 'enemy':
+                _, xpos, ypos, row, timer, visible, large = entry
+                explosion = sim.explode_enemy(Rect(xpos, ypos, enemies.width, enemies.height), row, timer)
+                if large:
+                    explosion.image, explosion.rect = explosion.image2, explosion.rect2
+            elif entry[0] == 'mystery':
+                _, xpos, ypos, score, timer, visible = entry
+                explosion = sim.mysteryExplosionPool.acquire(mystery, score, timer)
+                explosion.position = (xpos, ypos)
+            else:
+                _, xpos, ypos, timer, visible = entry
+                explosion = sim.shipExplosionPool.acquire(player, timer)
+                explosion.rect.topleft = (xpos, ypos)
+            explosion.visible = visible
+            explosion.add(sim.explosionsGroup)
+        return sim
+
+    def make_ship(self):
+        return Ship()
+
+    def make_bunkers(self):
+        layout = self.waves.wave(self.wave).bunkers
+        self.bunkerLayout = layout
+        self.bunkerTop = layout.top
+        self.bunkers = [Bunker(xpos, ypos, layout.rows, layout.columns, layout.cellSize)
+                        for xpos, ypos in layout.positions()]
+        self.bunkerHash = SpatialHash(BUNKER_CELL_SIZE)
+        self.bunkerHash.rebuild(self.bunkers)
+
+    def make_enemies(self, current_time):
+        wave = self.waves.wave(self.wave)
+        self.enemies = EnemiesGroup(wave, self.enemyPosition, current_time, self.random)
+        self.enemies.moveTime = wave.moveTime // self.difficulty
+
+    def begin_wave(self, wave, current_time):
+        self.wave = wave
+        self.enemyPosition = self.waves.position(wave)
+        if self.waves.wave(wave).bunkers is not self.bunkerLayout:
+            self.make_bunkers()
+        self.reset(self.score, current_time)
+
+    def between_waves(self):
+        return not self.enemies and not self.explosionsGroup
+
+    def step(self, left=False, right=False, fire=False):
+        if not self.startGame:
+            return
+        self.tick += 1
+        current_time = self.time
+        if fire:
+            self.fire()
+        if self.between_waves():
+            if current_time - self.gameTimer > 3000:
+                self.begin_wave(self.wave + 1, current_time)
+                self.gameTimer += 3000
+            return
+        clock = self.phaseClock
+        self.play_main_music(current_time)
+        self.enemies.update(current_time)
+        if clock:
+            clock.lap('enemies.update')
+        self.allSprites.update(current_time, left, right)
+        self.explosionsGroup.update(current_time)
+        if clock:
+            clock.lap('allSprites.update')
+        self.check_collisions(current_time)
+        if clock:
+            clock.lap('check_collisions')
+        self.create_new_ship(current_time)
+        self.make_enemies_shoot(current_time)
+        if clock:
+            clock.lap('spawning')
+
+    def play_main_music(self, current_time):
+        if current_time - self.noteTimer > self.enemies.moveTime:
+            self.events.append(('play', str(self.noteIndex)))
+            if self.noteIndex < 3:
+                self.noteIndex += 1
+            else:
+                self.noteIndex = 0
+            self.noteTimer += self.enemies.moveTime
+
+    def fire(self):
+        if not self.shipAlive or len(self.bullets) != 0:
+            return
+        if self.score < 1000:
+            bullet = self.bulletPool.acquire(self.player.rect.x + 23, self.player.rect.y + 5, -1, 15, 'laser', 'center')
+            bullet.add(self.bullets, self.allSprites)
+            self.events.append(('play', 'shoot'))
+        else:
+            leftbullet = self.bulletPool.acquire(self.player.rect.x + 8, self.player.rect.y + 5, -1, 15, 'laser', 'left')
+            rightbullet = self.bulletPool.acquire(self.player.rect.x + 38, self.player.rect.y + 5, -1, 15, 'laser',
+                                                  'right')
+            leftbullet.add(self.bullets, self.allSprites)
+            rightbullet.add(self.bullets, self.allSprites)
+            self.events.append(('play', 'shoot2'))
+
+    def make_enemies_shoot(self, current_time):
+        wave = self.enemies.wave
+        if (current_time - self.timer) > (wave.fireInterval // self.difficulty) and self.enemies:
+            for _ in range(wave.volley):
+                enemy = self.enemies.rect(*self.enemies.random_bottom())
+                bullet = self.bulletPool.acquire(enemy.centerx - 6, enemy.centery + 3, 1, wave.bulletSpeed,
+                                                 'enemylaser', 'center')
+                bullet.add(self.enemyBullets, self.allSprites)
+            self.timer = current_time
+
+    def calculate_score(self, row):
+        score = self.enemies.wave.rowTypes[row].score
+        self.score += score
+        return score
+
+    def explode_enemy(self, rect, row, current_time):
+        return self.enemyExplosionPool.acquire(rect, row, self.enemies.wave.rowTypes[row].explosion, current_time)
+
+    def check_collisions(self, current_time):
+        bullets = self.bullets.sprites()
+        enemyBullets = self.enemyBullets.sprites()
+        if enemyBullets:
+            self.bulletHash.rebuild(enemyBullets)
+        else:
+            self.bulletHash.clear()
+
+        if bullets and self.bulletHash:
+            for bullet in bullets:
+                hits = [hit for hit in self.bulletHash.query(bullet.rect) if hit.alive()]
+                if hits:
+                    bullet.kill()
+                    for hit in hits:
+                        hit.kill()
+            bullets = [bullet for bullet in bullets if bullet.alive()]
+
+        if bullets and self.enemies:
+            for bullet in bullets:
+                if bullet.rect.top >= self.enemies.bottom:
+                    continue
+                hits = self.enemies.collide(bullet.rect)
+                if hits:
+                    bullet.kill()
+                for row, column in hits:
+                    self.events.append(('play', 'invaderkilled'))
+                    self.calculate_score(row)
+                    self.explode_enemy(self.enemies.rect(row, column), row, current_time).add(self.explosionsGroup)
+                    self.enemies.kill(row, column)
+                    self.gameTimer = current_time
+            bullets = [bullet for bullet in bullets if bullet.alive()]
+
+        mystery = self.mysteryShip
+        if bullets and mystery.rect.right > 0 and mystery.rect.left < 800:
+            hits = [bullet for bullet in bullets if bullet.rect.colliderect(mystery.rect)]
+            if hits:
+                for bullet in hits:
+                    bullet.kill()
+                self.destroy_mystery(current_time)
+                bullets = [bullet for bullet in bullets if bullet.alive()]
+
+        if self.player.alive() and self.bulletHash:
+            hits = [hit for hit in self.bulletHash.query(self.player.rect) if hit.alive()]
+            if hits:
+                for hit in hits:
+                    hit.kill()
+                self.destroy_player(current_time)
+
+        if self.enemies.bottom >= 540:
+            if self.player.alive():
+                hits = self.enemies.collide(self.player.rect)
+                if hits:
+                    self.player.kill()
+                for row, column in hits:
+                    self.enemies.kill(row, column)
+            if not self.player.alive() or self.enemies.bottom >= 600:
+                self.gameOver = True
+                self.startGame = False
+
+        self.collide_bunkers(bullets)
+        self.collide_bunkers(self.enemyBullets.sprites())
+        if self.enemies.bottom >= self.bunkerTop:
+            for bunker in self.bunkers:
+                for row, column in self.enemies.collide(bunker.rect):
+                    bunker.hit(self.enemies.rect(row, column))
+
+    def collide_bunkers(self, bullets):
+        for bullet in bullets:
+            if bullet.rect.bottom <= self.bunkerTop:
+                continue
+            for bunker in self.bunkerHash.query(bullet.rect):
+                if bunker.hit(bullet.rect):
+                    bullet.kill()
+
+    def destroy_mystery(self, current_time):
+        mystery = self.mysteryShip
+        mystery.kill()
+        self.events.append(('stop', 'mysteryentered'))
+        self.events.append(('play', 'mysterykilled'))
+        score = self.random.choice(MYSTERY_SCORES)
+        self.score += score
+        self.mysteryExplosionPool.acquire(mystery, score, current_time).add(self.explosionsGroup)
+        self.mysteryShip = Mystery(current_time, self.events)
+        self.allSprites.add(self.mysteryShip)
+        self.mysteryGroup.add(self.mysteryShip)
+
+    def destroy_player(self, current_time):
+        player = self.player
+        player.kill()
+        if self.lives > 0:
+            self.lives -= 1
+        else:
+            self.gameOver = True
+            self.startGame = False
+        self.events.append(('play', 'shipexplosion'))
+        self.shipExplosionPool.acquire(player, current_time).add(self.explosionsGroup)
+        self.makeNewShip = True
+        self.shipTimer = current_time
+        self.shipAlive = False
+
+    def create_new_ship(self, current_time):
+        if self.makeNewShip and (current_time - self.shipTimer > 900):
+            self.player = self.make_ship()
+            self.allSprites.add(self.player)
+            self.playerGroup.add(self.player)
+            self.makeNewShip = False
+            self.shipAlive = True
+
+
+def run_headless(ticks=10000, difficulty=1, seed=0):
+    from time import perf_counter
+
+    sim = Simulation(difficulty, seed)
+    sim.start()
+    games = 1
+    start = perf_counter()
+    for tick in range(1, ticks + 1):
+        sim.step(fire=tick % 10 == 0)
+        del sim.events[:]
+        if sim.gameOver:
+            sim = Simulation(difficulty, seed + games)
+            sim.start()
+            games += 1
+    elapsed = perf_counter() - start
+    return ticks / elapsed if elapsed else float('inf'), games
+
+
+if __name__ == '__main__':
+    ticks_per_second, games = run_headless()
+    print('{:.0f} ticks/s over {} game(s)'.format(ticks_per_second, games))
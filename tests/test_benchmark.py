@@ -0,0 +1,30 @@
+from random import Random
+
+from benchmark import LATE_WAVE, compare, setup_late_wave
+from leaderboard import MEMORY_DATABASE, Leaderboard
+from main import SpaceInvaders
+
+
+def results(p50, p99):
+    return {'scenarios': {'stress': {'frame_ms': {'p50': p50, 'p99': p99}}}}
+
+
+def test_jitter_below_the_floor_is_not_a_regression():
+    assert compare(results(0.035, 0.117), results(0.015, 0.050)) == []
+
+
+def test_large_slowdown_is_a_regression():
+    regressions = compare(results(1.0, 4.0), results(0.5, 2.0))
+    assert [(regression['stat'], regression['baseline_ms']) for regression in regressions] == [('p50', 0.5),
+                                                                                             ('p99', 2.0)]
+
+
+def test_late_wave_starts_from_the_late_formation():
+    game = SpaceInvaders(seed=0, leaderboard=Leaderboard(MEMORY_DATABASE, None))
+    setup_late_wave(game, Random(0))
+    sim = game.sim
+    wave = sim.waves.wave(LATE_WAVE)
+    assert sim.enemies.y == sim.waves.position(LATE_WAVE) > sim.waves.position(1)
+    assert sim.enemies.wave is wave
+    assert sim.enemies.alive.sum() == 4
+    game.leaderboard.close()
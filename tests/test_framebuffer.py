@@ -0,0 +1,30 @@
+from pygame import Surface
+
+from framebuffer import FrameExporter, FrameReader
+
+
+def test_reader_attached_before_the_first_frame_gets_the_channel_order():
+    surface = Surface((8, 4), depth=32)
+    surface.fill((250, 5, 7))
+    exporter = FrameExporter(surface.get_size(), slots=2)
+    try:
+        reader = FrameReader(exporter.name)
+        sequence = exporter.publish(surface)
+        assert reader.valid(sequence)
+        assert reader.rgb(reader.frame(sequence))[0, 0].tolist() == [250, 5, 7]
+        reader.close()
+    finally:
+        exporter.close()
+
+
+def test_reader_attached_after_the_first_frame():
+    surface = Surface((8, 4), depth=32)
+    surface.fill((1, 2, 3))
+    exporter = FrameExporter(surface.get_size(), slots=2)
+    try:
+        exporter.publish(surface)
+        reader = FrameReader(exporter.name)
+        assert reader.rgb(reader.frame(reader.sequence))[3, 7].tolist() == [1, 2, 3]
+        reader.close()
+    finally:
+        exporter.close()
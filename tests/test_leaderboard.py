@@ -0,0 +1,41 @@
+import json
+
+from leaderboard import Leaderboard
+
+
+def legacy_file(tmp_path):
+    path = tmp_path / 'scores.txt'
+    path.write_text(json.dumps([900, 500, 0, 0, 0]))
+    return str(path)
+
+
+def test_legacy_scores_show_in_the_difficulty_one_table(tmp_path):
+    board = Leaderboard(str(tmp_path / 'board.sqlite3'), legacy_file(tmp_path))
+    assert board.scores(1) == [900, 500, 0, 0, 0]
+    assert board.scores(2) == [0, 0, 0, 0, 0]
+    assert board.scores() == [900, 500, 0, 0, 0]
+    board.close()
+
+
+
+class NoQueries(object):
+    def execute(self, *args):
+        raise AssertionError('submit queried the database')
+
+    def close(self):
+        pass
+
+
+def test_submit_ranks_from_memory(tmp_path):
+    board = Leaderboard(str(tmp_path / 'board.sqlite3'), legacy_file(tmp_path))
+    board.connection, connection = NoQueries(), board.connection
+    assert board.submit(700, 1) == [900, 700, 500, 0, 0]
+    assert board.submit(100, 2) == [100, 0, 0, 0, 0]
+    assert board.submit(950, 2) == [950, 100, 0, 0, 0]
+    board.flush()
+    board.connection = connection
+    assert board.scores(1) == [900, 700, 500, 0, 0]
+    assert board.scores(2) == [950, 100, 0, 0, 0]
+    assert board.scores() == [950, 900, 700, 500, 100]
+    assert board.load_tops() == board.tops
+    board.close()
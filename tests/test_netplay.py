@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+import pytest
+
+import netplay
+from netplay import BYE, HELLO, INPUT, INPUT_MESSAGE, PROTOCOL_VERSION, WELCOME, Server, frame, read_frame
+
+
+def hello(**fields):
+    message = {'version': PROTOCOL_VERSION, 'mode': 'coop', 'players': 1, 'difficulty': 1, 'waves': 'classic'}
+    message.update(fields)
+    return frame(HELLO, json.dumps(message).encode())
+
+
+async def connect(server, message):
+    reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+    writer.write(message)
+    return reader, writer
+
+
+async def reply(reader):
+    kind, payload = await asyncio.wait_for(read_frame(reader), 5)
+    return kind, json.loads(payload)
+
+
+def run(test):
+    async def main():
+        server = await Server('127.0.0.1', 0, 1).start()
+        try:
+            await test(server)
+        finally:
+            await server.close()
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('fields', [{'difficulty': 0}, {'difficulty': -5}, {'difficulty': '2'}, {'players': 0},
+                                    {'players': [2]}, {'mode': 'solo'}, {'waves': ['classic']}, {'version': 0}])
+def test_bad_hello_gets_an_error(fields):
+    async def test(server):
+        reader, writer = await connect(server, hello(**fields))
+        kind, message = await reply(reader)
+        assert kind == BYE and 'error' in message
+        assert not server.lobby
+        writer.close()
+    run(test)
+
+
+def test_hello_that_is_not_json_gets_an_error():
+    async def test(server):
+        reader, writer = await connect(server, frame(HELLO, b'\xff{'))
+        kind, message = await reply(reader)
+        assert kind == BYE and 'error' in message
+        writer.close()
+    run(test)
+
+
+def test_players_waiting_hear_when_the_session_cannot_start(monkeypatch):
+    def broken(*args):
+        raise ZeroDivisionError('integer division or modulo by zero')
+    monkeypatch.setattr(netplay, 'CoopSimulation', broken)
+
+    async def test(server):
+        first, firstWriter = await connect(server, hello(players=2))
+        await asyncio.sleep(0.05)
+        second, secondWriter = await connect(server, hello(players=2))
+        for reader in (first, second):
+            kind, message = await reply(reader)
+            assert kind == BYE and 'error' in message
+        assert not server.lobby and not server.sessions
+        firstWriter.close()
+        secondWriter.close()
+    run(test)
+
+
+def test_good_hello_is_welcomed():
+    async def test(server):
+        reader, writer = await connect(server, hello(difficulty=3))
+        kind, message = await reply(reader)
+        assert kind == WELCOME and message['difficulty'] == 3
+        writer.close()
+    run(test)
+
+
+async def closed(reader):
+    # Frames already on their way are skipped until the server hangs up.
+    try:
+        while True:
+            await asyncio.wait_for(read_frame(reader), 5)
+    except asyncio.IncompleteReadError:
+        return True
+
+
+def test_truncated_input_closes_only_that_connection():
+    async def test(server):
+        reader, writer = await connect(server, hello(players=2))
+        other, otherWriter = await connect(server, hello(players=2))
+        assert (await reply(reader))[0] == WELCOME
+        assert (await reply(other))[0] == WELCOME
+        writer.write(frame(INPUT, INPUT_MESSAGE.pack(1, 0, 0)[:5]))
+        assert await closed(reader)
+        session = server.sessions[0]
+        assert [player.connected for player in session.players] == [False, True]
+        otherWriter.write(frame(INPUT, INPUT_MESSAGE.pack(1, 0, 2)))
+        await asyncio.wait_for(read_frame(other), 5)
+        assert not session.finished
+        writer.close()
+        otherWriter.close()
+    run(test)
+
+
+def test_truncated_input_in_the_lobby_leaves_it():
+    async def test(server):
+        reader, writer = await connect(server, hello(players=2))
+        writer.write(frame(INPUT, b'\x01'))
+        assert await closed(reader)
+        assert not server.lobby
+        writer.close()
+    run(test)
+
+
+def test_truncated_input_is_answered_with_an_error():
+    async def test(server):
+        reader, writer = await connect(server, hello(players=2))
+        writer.write(frame(INPUT, b'\x01'))
+        kind, message = await reply(reader)
+        assert kind == BYE and 'error' in message
+        writer.close()
+    run(test)
+
+
+def test_server_bugs_are_not_taken_for_bad_frames(monkeypatch):
+    def broken(*args):
+        raise KeyError('pilot')
+    monkeypatch.setattr(netplay.Player, 'push', broken)
+    errors = []
+
+    async def test(server):
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        reader, writer = await connect(server, hello(players=2))
+        writer.write(frame(INPUT, INPUT_MESSAGE.pack(1, 0, 0)))
+        assert await closed(reader)
+        assert not server.lobby
+        writer.close()
+    run(test)
+    assert any(isinstance(context.get('exception'), KeyError) for context in errors)
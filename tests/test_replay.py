@@ -0,0 +1,35 @@
+import main
+from leaderboard import Leaderboard
+from replay import Replay, ReplayRecorder
+from simulation import TICK_MS, TICK_RATE, Simulation
+
+
+def record(path, ticks):
+    sim = Simulation(seed=7)
+    sim.start()
+    recorder = ReplayRecorder(str(path), keyframe_ticks=TICK_RATE)
+    recorder.begin(sim)
+    for tick in range(ticks):
+        fire = tick % 20 == 0
+        sim.step(False, tick % 60 < 30, fire)
+        recorder.record(sim, False, tick % 60 < 30, fire)
+    recorder.close()
+    return Replay.load(str(path))
+
+
+def test_seek_clamps_to_the_last_tick(tmp_path):
+    replay = record(tmp_path / 'game.sirp', 150)
+    sim = replay.seek(10 * TICK_RATE)
+    assert sim.tick == replay.last_tick
+
+
+def test_playback_sought_past_the_end_finishes(tmp_path, monkeypatch):
+    replay = record(tmp_path / 'game.sirp', 150)
+    monkeypatch.setattr(main, 'Leaderboard', lambda: Leaderboard(str(tmp_path / 'board.sqlite3'), None))
+    game = main.SpaceInvaders(seed=7, replay=replay, replay_start=10 * TICK_RATE)
+    game.start_game()
+    game.update_game(TICK_MS * 3)
+    assert game.gameOver
+    assert not game.startGame
+    assert game.sim.tick == replay.last_tick
+    game.leaderboard.close()
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+
+from pygame import font
+
+SURFACE_CACHE_SIZE = 256
+DIGITS = '0123456789'
+
+_fonts = {}
+_surfaces = OrderedDict()
+_atlases = {}
+
+
+def get_font(path, size):
+    key = (path, size)
+    cached = _fonts.get(key)
+    if cached is None:
+        cached = _fonts[key] = font.Font(path, size)
+    return cached
+
+
+def render(path, size, message, color):
+    # Surfaces are shared between callers and must not be drawn on.
+    key = (path, message, size, tuple(color))
+    surface = _surfaces.get(key)
+    if surface is not None:
+        _surfaces.move_to_end(key)
+        return surface
+    surface = get_font(path, size).render(message, True, color)
+    _surfaces[key] = surface
+    if len(_surfaces) > SURFACE_CACHE_SIZE:
+        _surfaces.popitem(last=False)
+    return surface
+
+
+def get_digit_atlas(path, size, color):
+    key = (path, size, tuple(color))
+    atlas = _atlases.get(key)
+    if atlas is None:
+        atlas = _atlases[key] = DigitAtlas(path, size, color)
+    return atlas
+
+
+def clear():
+    _fonts.clear()
+    _surfaces.clear()
+    _atlases.clear()
+
+
+class DigitAtlas(object):
+    def __init__(self, path, size, color):
+        textFont = get_font(path, size)
+        self.glyphs = {digit: textFont.render(digit, True, color) for digit in DIGITS}
+        self.advances = {digit: glyph.get_width() for digit, glyph in self.glyphs.items()}
+        self.height = max(glyph.get_height() for glyph in self.glyphs.values())
+
+    def blits(self, value, xpos, ypos):
+        sequence = []
+        for digit in str(value):
+            sequence.append((self.glyphs[digit], (xpos, ypos)))
+            xpos += self.advances[digit]
+        return sequence
+
+    def width(self, value):
+        return sum(self.advances[digit] for digit in str(value))
+
+
+class NumberText(object):
+    def __init__(self, textFont, size, color, xpos, ypos):
+        self.atlas = get_digit_atlas(textFont, size, color)
+        self.xpos = xpos
+        self.ypos = ypos
+        self.value = None
+        self.sequence = []
+
+    def draw(self, surface, value):
+        if value != self.value:
+            self.value = value
+            self.sequence = self.atlas.blits(value, self.xpos, self.ypos)
+        surface.blits(self.sequence, doreturn=False)
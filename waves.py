@@ -0,0 +1,221 @@
+import json
+
+import numpy as np
+
+from config import IMG_NAMES, SCREEN_SIZE, WAVES_FILE
+
+DEFAULT_WAVES = 'classic'
+WAVE_FIELDS = ['formation', 'columns', 'shape', 'left', 'top', 'advance', 'column_width', 'row_height', 'enemy_size',
+               'move_time', 'moves', 'step', 'drop', 'speedups', 'fire_interval', 'volley', 'bullet_speed', 'bunkers']
+BUNKER_FIELDS = ['count', 'left', 'spacing', 'top', 'rows', 'columns', 'cell_size']
+ENEMY_FIELDS = ['images', 'explosion', 'score']
+EXPLOSION_GROWTH = 10
+
+
+class WaveError(Exception):
+    pass
+
+
+def check_fields(where, data, fields):
+    if not isinstance(data, dict):
+        raise WaveError('{} must be an object'.format(where))
+    unknown = sorted(set(data) - set(fields))
+    if unknown:
+        raise WaveError('{}: unknown field(s) {}'.format(where, ', '.join(unknown)))
+    missing = [field for field in fields if field not in data]
+    if missing:
+        raise WaveError('{}: missing field(s) {}'.format(where, ', '.join(missing)))
+
+
+def positive(where, value, zero=False):
+    if isinstance(value, bool) or not isinstance(value, int) or value < (0 if zero else 1):
+        raise WaveError('{} must be a {} integer, not {!r}'.format(where, 'non-negative' if zero else 'positive',
+                                                                  value))
+    return value
+
+
+def image_name(where, value):
+    if value not in IMG_NAMES:
+        raise WaveError('{}: unknown image {!r}'.format(where, value))
+    return value
+
+
+class EnemyType(object):
+    def __init__(self, where, name, data):
+        check_fields(where, data, ENEMY_FIELDS)
+        if not isinstance(data['images'], list) or len(data['images']) != 2:
+            raise WaveError('{}.images must list the two animation frames'.format(where))
+        self.name = name
+        self.images = [image_name('{}.images'.format(where), value) for value in data['images']]
+        self.explosion = image_name('{}.explosion'.format(where), data['explosion'])
+        self.score = positive('{}.score'.format(where), data['score'], zero=True)
+
+
+class BunkerLayout(object):
+    def __init__(self, where, name, data):
+        check_fields(where, data, BUNKER_FIELDS)
+        self.name = name
+        self.count = positive('{}.count'.format(where), data['count'], zero=True)
+        self.left = positive('{}.left'.format(where), data['left'], zero=True)
+        self.spacing = positive('{}.spacing'.format(where), data['spacing'])
+        self.top = positive('{}.top'.format(where), data['top'])
+        self.rows = positive('{}.rows'.format(where), data['rows'])
+        self.columns = positive('{}.columns'.format(where), data['columns'])
+        self.cellSize = positive('{}.cell_size'.format(where), data['cell_size'])
+        if self.count and self.columns * self.cellSize > self.spacing:
+            raise WaveError('{}: bunkers {} px wide overlap at a {} px spacing'.format(
+                where, self.columns * self.cellSize, self.spacing))
+        if self.count and self.left + (self.count - 1) * self.spacing + self.columns * self.cellSize > SCREEN_SIZE[0]:
+            raise WaveError('{}: the last bunker ends off screen'.format(where))
+
+    def positions(self):
+        return [(self.left + self.spacing * number, self.top) for number in range(self.count)]
+
+
+class Wave(object):
+    def __init__(self, where, data, enemies, bunkers):
+        check_fields(where, data, WAVE_FIELDS)
+        formation = data['formation']
+        if not isinstance(formation, list) or not formation:
+            raise WaveError('{}.formation must list the enemy type of every row'.format(where))
+        for row, name in enumerate(formation):
+            if name not in enemies:
+                raise WaveError('{}.formation[{}]: unknown enemy type {!r}'.format(where, row, name))
+        self.rowTypes = [enemies[name] for name in formation]
+        self.rows = len(formation)
+        self.columns = positive('{}.columns'.format(where), data['columns'])
+        self.shape = self.parse_shape(where, data['shape'])
+        self.left = positive('{}.left'.format(where), data['left'], zero=True)
+        self.top = positive('{}.top'.format(where), data['top'], zero=True)
+        self.advance = positive('{}.advance'.format(where), data['advance'], zero=True)
+        self.columnWidth = positive('{}.column_width'.format(where), data['column_width'])
+        self.rowHeight = positive('{}.row_height'.format(where), data['row_height'])
+        size = data['enemy_size']
+        if not isinstance(size, list) or len(size) != 2:
+            raise WaveError('{}.enemy_size must be [width, height]'.format(where))
+        self.width = positive('{}.enemy_size'.format(where), size[0])
+        self.height = positive('{}.enemy_size'.format(where), size[1])
+        # The formation cache and the grid collision test both rely on invaders never overlapping.
+        if self.width > self.columnWidth or self.height > self.rowHeight:
+            raise WaveError('{}: enemies {}x{} do not fit a {}x{} cell'.format(
+                where, self.width, self.height, self.columnWidth, self.rowHeight))
+        self.moveTime = positive('{}.move_time'.format(where), data['move_time'])
+        self.moves = positive('{}.moves'.format(where), data['moves'])
+        self.step = positive('{}.step'.format(where), data['step'])
+        self.drop = positive('{}.drop'.format(where), data['drop'], zero=True)
+        self.speedups = self.parse_speedups(where, data['speedups'])
+        self.fireInterval = positive('{}.fire_interval'.format(where), data['fire_interval'])
+        self.volley = positive('{}.volley'.format(where), data['volley'])
+        self.bulletSpeed = positive('{}.bullet_speed'.format(where), data['bullet_speed'])
+        if data['bunkers'] not in bunkers:
+            raise WaveError('{}.bunkers: unknown bunker layout {!r}'.format(where, data['bunkers']))
+        self.bunkers = bunkers[data['bunkers']]
+
+        # The formation starts half way through its sweep, so it has to stay on screen at both ends of it.
+        reach = (self.moves - self.moves // 2) * self.step
+        right = self.left + reach + (self.columns - 1) * self.columnWidth + self.width
+        if self.left < self.moves // 2 * self.step or right > SCREEN_SIZE[0]:
+            raise WaveError('{}: the formation sweeps off screen ({} to {} px)'.format(
+                where, self.left - self.moves // 2 * self.step, right))
+
+    def parse_shape(self, where, shape):
+        if shape is None:
+            return np.ones((self.rows, self.columns), dtype=bool)
+        if not isinstance(shape, list) or len(shape) != self.rows:
+            raise WaveError('{}.shape must have one line per formation row'.format(where))
+        for row, line in enumerate(shape):
+            if not isinstance(line, str) or len(line) != self.columns or set(line) - set('#.'):
+                raise WaveError('{}.shape[{}] must be {} characters of "#" or "."'.format(where, row, self.columns))
+        alive = np.array([[cell == '#' for cell in line] for line in shape], dtype=bool)
+        if not alive.any():
+            raise WaveError('{}.shape has no enemies'.format(where))
+        return alive
+
+    @staticmethod
+    def parse_speedups(where, speedups):
+        if not isinstance(speedups, list):
+            raise WaveError('{}.speedups must list [enemies left, move time] pairs'.format(where))
+        parsed = []
+        for index, pair in enumerate(speedups):
+            if not isinstance(pair, list) or len(pair) != 2:
+                raise WaveError('{}.speedups[{}] must be [enemies left, move time]'.format(where, index))
+            parsed.append((positive('{}.speedups[{}]'.format(where, index), pair[0]),
+                           positive('{}.speedups[{}]'.format(where, index), pair[1])))
+        # The tightest threshold has to win, so they are checked from the fewest enemies up.
+        return sorted(parsed)
+
+    def speed(self, count):
+        for threshold, moveTime in self.speedups:
+            if count <= threshold:
+                return moveTime
+        return None
+
+    @property
+    def count(self):
+        return int(self.shape.sum())
+
+
+class WaveSet(object):
+    def __init__(self, name, waves, ranked):
+        self.name = name
+        self.waves = waves
+        self.ranked = ranked
+
+    def wave(self, number):
+        return self.waves[min(number, len(self.waves)) - 1]
+
+    def position(self, number):
+        # Past the last defined wave the last one repeats, starting that much lower every time.
+        if number <= len(self.waves):
+            return self.waves[number - 1].top
+        last = self.waves[-1]
+        return last.top + last.advance * (number - len(self.waves))
+
+    def scaled_images(self):
+        variants = set()
+        for wave in self.waves:
+            size = (wave.width, wave.height)
+            grown = (wave.width + EXPLOSION_GROWTH, wave.height + EXPLOSION_GROWTH)
+            for enemy in wave.rowTypes:
+                variants.update((name, size) for name in enemy.images)
+                variants.update([(enemy.explosion, size), (enemy.explosion, grown)])
+        return sorted(variants)
+
+
+def load_waves(path=WAVES_FILE):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as error:
+        raise WaveError('Could not read wave definitions from {}: {}'.format(path, error))
+    check_fields(path, data, ['enemies', 'bunkers', 'defaults', 'sets'])
+    enemies = {name: EnemyType('enemies.{}'.format(name), name, value) for name, value in data['enemies'].items()}
+    bunkers = {name: BunkerLayout('bunkers.{}'.format(name), name, value) for name, value in data['bunkers'].items()}
+    check_fields('defaults', data['defaults'], WAVE_FIELDS)
+    sets = {}
+    for name, value in data['sets'].items():
+        check_fields('sets.{}'.format(name), value, ['ranked', 'waves'])
+        if not isinstance(value['waves'], list) or not value['waves']:
+            raise WaveError('sets.{}.waves must list at least one wave'.format(name))
+        waves = []
+        for index, wave in enumerate(value['waves']):
+            where = 'sets.{}.waves[{}]'.format(name, index)
+            if not isinstance(wave, dict):
+                raise WaveError('{} must be an object'.format(where))
+            waves.append(Wave(where, dict(data['defaults'], **wave), enemies, bunkers))
+        sets[name] = WaveSet(name, waves, bool(value['ranked']))
+    if DEFAULT_WAVES not in sets:
+        raise WaveError('{} has no {!r} wave set'.format(path, DEFAULT_WAVES))
+    return sets
+
+
+WAVES = load_waves()
+
+
+if __name__ == '__main__':
+    for waveSet in WAVES.values():
+        print('{}{}:'.format(waveSet.name, '' if waveSet.ranked else ' (unranked)'))
+        for number, wave in enumerate(waveSet.waves, 1):
+            print('  wave {}: {} invaders in {}x{}, move every {} ms, {} shot(s) every {} ms, {} bunkers'.format(
+                number, wave.count, wave.rows, wave.columns, wave.moveTime, wave.volley, wave.fireInterval,
+                wave.bunkers.count))